@@ -3,5 +3,9 @@
 name = 'Google Jukebox'
 __version__ = '1.0.0'
 
-from sound_lib.output import Output
-output = Output()
+from jukebox import fake
+if fake.enabled:
+    output = fake.FakeOutput()
+else:
+    from sound_lib.output import Output
+    output = Output()
@@ -0,0 +1,141 @@
+"""
+Simulates browser tabs using a running jukebox, reporting throughput and latency for each route.
+
+Start the jukebox with fake music so Google is never contacted, then run the load generator against it:
+
+    python main.py --fake -p 8080
+    python -m benchmarks.load --url http://localhost:8080 --tabs 100 --duration 60
+
+Each tab polls /json like index.html does, and now and then searches or queues a track.
+"""
+
+import json
+import random
+from math import ceil
+from argparse import ArgumentParser
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from time import time
+from urllib.parse import quote
+from twisted.internet import reactor, task
+from twisted.internet.defer import inlineCallbacks, returnValue, DeferredList
+from twisted.web.client import Agent, CookieAgent, HTTPConnectionPool, readBody
+from jukebox.fake import FakeClient, words, track_id
+
+def percentile(values, p):
+    """Return the p-th percentile of the sorted list values, using the nearest rank."""
+    if not values:
+        return 0.0
+    return values[max(0, ceil(p / 100.0 * len(values)) - 1)]
+
+class Stats:
+    """Latencies and errors for each route."""
+    def __init__(self):
+        self.latencies = defaultdict(list) # route: seconds pairs.
+        self.errors = defaultdict(int) # route: count pairs.
+
+    def record(self, route, seconds, ok):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    def report(self, elapsed):
+        """Return a dictionary of results for each route."""
+        results = {}
+        for route, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            results[route] = {
+                'requests': len(latencies),
+                'errors': self.errors[route],
+                'throughput': len(latencies) / elapsed,
+                'p50': percentile(latencies, 50) * 1000,
+                'p99': percentile(latencies, 99) * 1000
+            }
+        return results
+
+class Tab:
+    """One browser tab, with its own session cookie."""
+    def __init__(self, number, args, pool, stats):
+        self.number = number
+        self.args = args
+        self.agent = CookieAgent(Agent(reactor, pool = pool), CookieJar())
+        self.stats = stats
+        self.random = random.Random('%s:%d' % (args.seed, number))
+        self.version = 0 # The version returned by the last poll of /json.
+        self.client = FakeClient() # Only used to pick track ids which exist.
+
+    @inlineCallbacks
+    def get(self, route, path):
+        """Get path, recording the time taken under route. Returns the body, or None if the request failed."""
+        started = time()
+        try:
+            response = yield self.agent.request(b'GET', (self.args.url + path).encode())
+            body = yield readBody(response)
+        except Exception:
+            self.stats.record(route, time() - started, False)
+            returnValue(None)
+        self.stats.record(route, time() - started, response.code < 400)
+        returnValue(body)
+
+    @inlineCallbacks
+    def poll(self):
+        body = yield self.get('/json', '/json?since=%d' % self.version)
+        if body:
+            self.version = json.loads(body.decode())['version']
+
+    def search(self):
+        query = ' '.join(self.random.choice(words) for x in range(self.random.randint(1, 2)))
+        return self.get('/modern_search', '/modern_search/%s' % quote(query))
+
+    def queue(self):
+        id = track_id(*self.client.random_track(self.random.random()))
+        return self.get('/queue_track', '/queue_track/%s' % id)
+
+    @inlineCallbacks
+    def run(self, until):
+        """Use the jukebox until the given time."""
+        yield task.deferLater(reactor, self.random.uniform(0, self.args.poll_interval), lambda: None)
+        yield self.get('/', '/')
+        while time() < until:
+            yield self.poll()
+            if self.random.random() < self.args.search_rate * self.args.poll_interval:
+                yield self.search()
+                yield self.poll()
+            if self.random.random() < self.args.queue_rate * self.args.poll_interval:
+                yield self.queue()
+            yield task.deferLater(reactor, self.args.poll_interval, lambda: None)
+
+@inlineCallbacks
+def run(args):
+    """Run every tab, then print and save the results."""
+    stats = Stats()
+    pool = HTTPConnectionPool(reactor)
+    pool.maxPersistentPerHost = args.tabs
+    started = time()
+    tabs = [Tab(x, args, pool, stats) for x in range(args.tabs)]
+    yield DeferredList([tab.run(started + args.duration) for tab in tabs])
+    results = stats.report(time() - started)
+    print('%-16s %9s %7s %9s %9s %9s' % ('route', 'requests', 'errors', 'req/s', 'p50 ms', 'p99 ms'))
+    for route, r in results.items():
+        print('%-16s %9d %7d %9.1f %9.1f %9.1f' % (route, r['requests'], r['errors'], r['throughput'], r['p50'], r['p99']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'tabs': args.tabs, 'duration': args.duration, 'results': results}, f, indent = 1, sort_keys = True)
+    yield pool.closeCachedConnections()
+
+def main():
+    parser = ArgumentParser(description = 'Load test a running jukebox.')
+    parser.add_argument('--url', default = 'http://localhost:8080', help = 'The address of the jukebox')
+    parser.add_argument('--tabs', type = int, default = 50, help = 'How many browser tabs to simulate')
+    parser.add_argument('--duration', type = float, default = 60.0, help = 'How many seconds to run for')
+    parser.add_argument('--poll-interval', type = float, default = 1.0, help = 'How many seconds each tab waits between polls of /json')
+    parser.add_argument('--search-rate', type = float, default = 0.05, help = 'How many searches each tab makes per second')
+    parser.add_argument('--queue-rate', type = float, default = 0.01, help = 'How many tracks each tab queues per second')
+    parser.add_argument('--seed', default = 'jukebox', help = 'The seed for choosing searches and tracks')
+    parser.add_argument('--output', help = 'A file to write the results to as json')
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+    task.react(lambda reactor: run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Offline microbenchmarks for the jukebox's hot paths.
+
+Run from the top of the repository:
+
+    python -m benchmarks.run [--save] [--baseline benchmarks/baseline.json]
+
+Google is never contacted: jukebox.api is replaced with a client which answers from the payloads in benchmarks/fixtures.
+Results are compared with the baseline if there is one, and written to it with --save.
+"""
+
+import json
+import os.path
+import platform
+import shutil
+import sys
+import tempfile
+import types
+import zlib
+from argparse import ArgumentParser
+from timeit import Timer
+
+fixtures_dir = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def load_fixture(name):
+    """Load benchmarks/fixtures/<name>.json."""
+    with open(os.path.join(fixtures_dir, name + '.json'), 'r') as f:
+        return json.load(f)
+
+class FixtureClient:
+    """Answers the Mobileclient calls made by the jukebox from fixtures."""
+    def __init__(self):
+        self.search_results = load_fixture('search')
+        self.album = load_fixture('album')
+        self.artist = load_fixture('artist')
+        self.playlist = load_fixture('playlist')
+
+    def search(self, query, max_results = 50):
+        return self.search_results
+
+    def get_album_info(self, album_id, include_tracks = True):
+        return self.album
+
+    def get_artist_info(self, artist_id, include_albums = True, max_top_tracks = 5, max_rel_artist = 5):
+        return self.artist
+
+    def get_track_info(self, store_track_id):
+        return self.playlist[0]['track']
+
+    def get_shared_playlist_contents(self, share_token):
+        return self.playlist
+
+    def get_station_tracks(self, station_id, num_tracks = 25, recently_played_ids = None):
+        return [entry['track'] for entry in self.playlist[:num_tracks]]
+
+    def get_stream_url(self, song_id, device_id = None, quality = 'hi'):
+        return 'http://localhost/stream/%s' % song_id
+
+def install_fixture_api():
+    """Replace jukebox.api, which logs in to Google when imported, with one backed by FixtureClient."""
+    import jukebox # The package must be imported before one of its modules can be replaced.
+    module = types.ModuleType('jukebox.api')
+    module.api = FixtureClient()
+    module.async_api = _SyncDeferredClient(module.api)
+    sys.modules['jukebox.api'] = module
+
+class _SyncDeferredClient:
+    """Calls the client straight away, returning fired Deferreds, so routes can be benchmarked without a running reactor."""
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        from twisted.internet.defer import maybeDeferred
+        return lambda *args, **kwargs: maybeDeferred(getattr(self.client, name), *args, **kwargs)
+
+class BenchRequest:
+    """Just enough of a twisted.web request for pages.get_json."""
+    def __init__(self, session, since = None):
+        from twisted.web.http_headers import Headers
+        self.session = session
+        self.path = b'/json'
+        self.method = b'GET'
+        self.args = {} if since is None else {b'since': [str(since).encode()]}
+        self.requestHeaders = Headers()
+        self.responseHeaders = Headers()
+        self.code = 200
+        self.startedWriting = True
+
+    def getSession(self):
+        return self.session
+
+    def setResponseCode(self, code):
+        self.code = code
+
+    def setHeader(self, name, value):
+        pass
+
+def measure(function, number = None):
+    """Time function, returning microseconds per call."""
+    timer = Timer(function)
+    if number is None:
+        number, _ = timer.autorange()
+    best = min(timer.repeat(repeat = 5, number = number))
+    return best / number * 1e6
+
+def clear_registries(metadata):
+    """Forget every metadata object."""
+    for registry in metadata.registries:
+        registry.objects.clear()
+
+def run():
+    """Run every benchmark in a scratch directory which is deleted afterwards, returning name: microseconds pairs."""
+    install_fixture_api()
+    from jukebox.lyrics_store import lyrics_store
+    from jukebox.lyrics import lyrics_scheduler
+    from jukebox.artwork import artwork_cache
+    scratch = tempfile.mkdtemp(prefix = 'jukebox-benchmarks-')
+    lyrics_store.path = os.path.join(scratch, 'lyrics.db')
+    artwork_cache.directory = os.path.join(scratch, 'artwork_cache')
+    lyrics_scheduler.workers = 0 # Queued tracks ask for lyrics, which must not be scraped.
+    try:
+        return run_benchmarks()
+    finally:
+        lyrics_store.close()
+        shutil.rmtree(scratch, ignore_errors = True)
+
+def run_benchmarks():
+    """Run every benchmark, returning name: microseconds pairs."""
+    from twisted.web.server import Session, Site
+    from twisted.web.resource import Resource
+    from twisted.internet.task import Clock
+    from jukebox import metadata, environment, util, pages, responses
+    from jukebox.app import app
+    from jukebox.settings import ISettings
+    from jukebox.result_sets import get_result_set
+    from jukebox.playback import Playback
+    search = load_fixture('search')
+    album = load_fixture('album')
+    artist = load_fixture('artist')
+    playlist = load_fixture('playlist')
+    songs = [hit['track'] for hit in search['song_hits']]
+    results = {}
+
+    def populate_cold():
+        clear_registries(metadata)
+        for song in songs:
+            metadata.get_track(song)
+        metadata.get_album(album)
+        metadata.get_artist(artist)
+    results['populate_cold'] = measure(populate_cold)
+    results['get_track_warm'] = measure(lambda: [metadata.get_track(song) for song in songs]) / len(songs)
+    results['get_album_warm'] = measure(lambda: metadata.get_album(album))
+    results['get_artist_warm'] = measure(lambda: metadata.get_artist(artist))
+    results['get_playlist_tracks'] = measure(lambda: [metadata.get_track(entry['track']) for entry in playlist])
+
+    tracks = [metadata.get_track(entry['track']) for entry in playlist]
+    a = metadata.get_artist(artist)
+    def clear_fragments():
+        for obj in tracks + [a]:
+            obj.fragments.clear()
+    results['format_track_cold'] = measure(lambda: (clear_fragments(), [environment.format_track(t) for t in tracks])) / len(tracks)
+    results['format_track_cached'] = measure(lambda: [environment.format_track(t) for t in tracks]) / len(tracks)
+    results['format_artist_cold'] = measure(lambda: (a.fragments.clear(), environment.format_artist(a)))
+    results['format_artist_cached'] = measure(lambda: environment.format_artist(a))
+
+    for track in tracks:
+        app.queue.append(track)
+    results['queue_duration'] = measure(util.queue_duration)
+
+    site = Site(Resource())
+    sessions = [Session(site, ('session-%d' % x).encode(), reactor = Clock()) for x in range(50)]
+    for session in sessions:
+        settings = ISettings(session)
+        settings.tracks = get_result_set('tracks', tracks[:20])
+        settings.artists = get_result_set('artists', a.related_artists)
+        settings.albums = get_result_set('albums', a.albums)
+        settings.artist = a
+    app.playback = Playback(tracks[-1], None, 0.0, 0.0, True)
+    results['get_json_full'] = measure(lambda: [pages.get_json(BenchRequest(session)) for session in sessions]) / len(sessions)
+    versions = [json.loads(pages.get_json(BenchRequest(session)))['version'] for session in sessions] # Each session's own version, so every request is answered with a 304.
+    body = pages.get_json(BenchRequest(sessions[0])).encode()
+    def compress_json():
+        encoder = responses.Encoder(BenchRequest(sessions[0]), 16 + zlib.MAX_WBITS)
+        return encoder.encode(body) + encoder.finish()
+    results['compress_json'] = measure(compress_json)
+    results['get_json_unchanged'] = measure(lambda: [pages.get_json(BenchRequest(session, since = version)) for session, version in zip(sessions, versions)]) / len(sessions)
+    return results
+
+def main():
+    parser = ArgumentParser(description = 'Run the offline benchmarks.')
+    parser.add_argument('--baseline', default = os.path.join(os.path.dirname(__file__), 'baseline.json'), help = 'The file to compare results with')
+    parser.add_argument('--save', action = 'store_true', help = 'Save the results as the new baseline')
+    args = parser.parse_args()
+    results = run()
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+    else:
+        baseline = {}
+    for name, value in sorted(results.items()):
+        line = '%-24s %12.2f us' % (name, value)
+        if name in baseline:
+            line += ' (%+.1f%%)' % ((value - baseline[name]) / baseline[name] * 100)
+        print(line)
+    if args.save:
+        import application
+        with open(args.baseline, 'w') as f:
+            json.dump({'version': application.__version__, 'python': platform.python_version(), 'results': results}, f, indent = 1, sort_keys = True)
+        print('Saved results to %s.' % args.baseline)
+
+if __name__ == '__main__':
+    main()
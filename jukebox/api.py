@@ -1,17 +1,101 @@
 """The gmusicapi Mobileclient instance."""
 
 from gmusicapi.clients import Mobileclient
+from time import monotonic
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, TimeoutError
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+from twisted.python.failure import Failure
+from . import fake
+from .metrics import Counter, Histogram
 
-api = Mobileclient()
+if fake.enabled:
+    api = fake.FakeClient()
+else:
+    api = Mobileclient()
 
-from configobj import ConfigObj
+    from configobj import ConfigObj
 
-config = ConfigObj('creds.ini')
-if not config.get('username'):
-    config['username'] = ''
-if not config.get('password'):
-    config['password'] = ''
+    config = ConfigObj('creds.ini')
+    if not config.get('username'):
+        config['username'] = ''
+    if not config.get('password'):
+        config['password'] = ''
 
-if not api.login(config['username'], config['password'], api.FROM_MAC_ADDRESS):
-    config.write()
-    raise ImportError('Incorrect or missing data found in creds.ini. Edit that file and try again.')
+    if not api.login(config['username'], config['password'], api.FROM_MAC_ADDRESS):
+        config.write()
+        raise ImportError('Incorrect or missing data found in creds.ini. Edit that file and try again.')
+
+calls = Counter('jukebox_api_calls_total', 'Calls to Google Play Music, by method.', labels = ('call',))
+call_errors = Counter('jukebox_api_errors_total', 'Calls to Google Play Music which failed or timed out, by method and error.', labels = ('call', 'error'))
+call_seconds = Histogram('jukebox_api_call_seconds', 'How long calls to Google Play Music took, by method.', labels = ('call',))
+
+class DeferredClient:
+    """Wraps a Mobileclient so its methods run in a bounded thread pool and return Deferreds, rather than blocking the reactor."""
+    def __init__(self, client, threads = 4, timeout = 30.0):
+        """Initialise with the client to wrap, the most calls to run at once, and the number of seconds before a call fails with twisted.internet.defer.TimeoutError."""
+        self.client = client
+        self.timeout = timeout
+        self.pool = ThreadPool(minthreads = 0, maxthreads = threads, name = 'api')
+        reactor.callWhenRunning(self.pool.start)
+        reactor.addSystemEventTrigger('during', 'shutdown', self.pool.stop)
+
+    def configure(self, threads = None, timeout = None):
+        """Change the size of the pool or the timeout."""
+        if threads is not None:
+            self.pool.adjustPoolsize(minthreads = 0, maxthreads = threads)
+        if timeout is not None:
+            self.timeout = timeout
+
+    def call(self, name, *args, **kwargs):
+        """Call the method called name on the client in the pool, returning a Deferred. The timeout starts once the call has a thread, so time spent waiting for one doesn't count against it."""
+        result = Deferred()
+        timer = [] # The delayed call which times result out, once the call has started.
+        d = deferToThreadPool(reactor, self.pool, self.run, result, timer, getattr(self.client, name), *args, **kwargs)
+        d.addBoth(self.finished, result, timer)
+        result.addBoth(self.called, name, monotonic())
+        return result
+
+    def run(self, result, timer, function, *args, **kwargs):
+        """Run function in a pool thread, first starting the timeout of result."""
+        if self.timeout:
+            reactor.callFromThread(self.started, result, timer)
+        return function(*args, **kwargs)
+
+    def started(self, result, timer):
+        """Start timing out result, unless it has been cancelled while it waited for a thread."""
+        if not result.called:
+            timer.append(reactor.callLater(self.timeout, self.timed_out, result))
+
+    def timed_out(self, result):
+        """Fail result because the call took too long. Whatever the call returns later is ignored."""
+        result.errback(TimeoutError('Call took more than %s seconds.' % self.timeout))
+
+    def finished(self, outcome, result, timer):
+        """Pass the outcome of a call on to result, unless result has timed out or been cancelled."""
+        for delayed in timer:
+            if delayed.active():
+                delayed.cancel()
+        if result.called:
+            return
+        if isinstance(outcome, Failure):
+            result.errback(outcome)
+        else:
+            result.callback(outcome)
+
+    def called(self, result, name, started):
+        """Record the time taken by a call and whether it failed."""
+        calls.inc(call = name)
+        call_seconds.observe(monotonic() - started, call = name)
+        if isinstance(result, Failure):
+            call_errors.inc(call = name, error = result.type.__name__)
+        return result
+
+    def __getattr__(self, name):
+        """Get a method of the client which returns a Deferred."""
+        if not callable(getattr(self.client, name)):
+            raise AttributeError('%r is not a method of %r.' % (name, self.client))
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+async_api = DeferredClient(api)
@@ -2,37 +2,30 @@
 
 import logging
 from klein import Klein
-from .api import api
+from .state import Versions
+from .events import event_stream
+from .lyrics import NEXT
+from .registry import pin_sources
+from .play_queue import PlayQueue
+from .playback import stopped
+from .metrics import Gauge
 
 logger = logging.getLogger(__name__)
 
 app = Klein()
-app.track = None # The currently-playing track.
-app.stream = None # The currently playing stream.
-app.queue = [] # The tracks to be played.
-app.owners = {} # track: owner pares.
-app.owner = None # The owner of the currently playing track.
+app.playback = stopped # What is playing, replaced by the player on every tick.
+app.queue = PlayQueue() # The tracks to be played, and who queued them.
+app.versions = Versions('now_playing', 'progress', 'lyrics', 'queue') # When each global section of /json last changed.
+app.versions.listeners.append(event_stream.publish)
+pin_sources.append(lambda: [app.playback.track] + list(app.queue))
 
-from sound_lib.stream import URLStream
+def queue_changed():
+    """Update /json and make sure the lyrics for the next track are on their way."""
+    app.versions.touch('queue')
+    if app.queue:
+        app.queue.peek().fetch_lyrics(NEXT)
 
-def play_manager():
-    """Play the next track."""
-    if app.stream is None or not app.stream.is_playing: # The current track has finished playing
-        if app.queue:
-            track = app.queue.pop(0)
-            if track in app.owners:
-                app.owner = app.owners[track]
-                del app.owners[track]
-            else:
-                app.owner = None
-            if track.artists[0].bio is None:
-                track.artists[0].populate(api.get_artist_info(track.artists[0].id))
-            url = api.get_stream_url(track.id)
-            app.stream = URLStream(url.encode())
-            logger.info('Playing track: %s.', track)
-            app.stream.play()
-            app.track = track
-        else:
-            app.track = None
-            app.stream = None
-            app.owner = None
+app.queue.listeners.append(queue_changed)
+
+Gauge('jukebox_queue_tracks', 'The number of tracks in the play queue.', lambda: len(app.queue))
+Gauge('jukebox_queue_seconds', 'The total duration of the play queue.', lambda: app.queue.duration_millis / 1000.0)
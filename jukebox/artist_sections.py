@@ -0,0 +1,37 @@
+"""Loads each section of an artist separately, only when it is needed."""
+
+from twisted.internet.defer import inlineCallbacks, returnValue, succeed
+from . import metadata
+from .api import async_api
+from .cache import DeferredCache
+
+# section: (the key Google returns it under, the arguments to get_artist_info which return only that section).
+sections = {
+    'header': (None, {'include_albums': False, 'max_top_tracks': 0, 'max_rel_artist': 0}),
+    'top_tracks': ('topTracks', {'include_albums': False, 'max_top_tracks': 5, 'max_rel_artist': 0}),
+    'albums': ('albums', {'include_albums': True, 'max_top_tracks': 0, 'max_rel_artist': 0}),
+    'related_artists': ('related_artists', {'include_albums': False, 'max_top_tracks': 0, 'max_rel_artist': 5})
+}
+
+@inlineCallbacks
+def _load(id, section):
+    """Fetch one section of an artist."""
+    key, arguments = sections[section]
+    data = yield async_api.get_artist_info(id, **arguments)
+    for other, (other_key, other_arguments) in sections.items():
+        if other_key is not None and other_key != key:
+            data.pop(other_key, None) # Don't mistake an empty list for a loaded section.
+    artist = metadata.get_artist(data)
+    artist.sections.add(section)
+    returnValue(artist)
+
+_cache = DeferredCache(_load, ttl = 0) # Only shares calls which are running at the same time; loaded sections are remembered by the artist.
+
+def load(id, section = 'header'):
+    """Return a Deferred which fires with the artist with the given id once section has been loaded."""
+    if section not in sections:
+        raise KeyError('No such artist section: %r.' % section)
+    artist = metadata.artists.get(id)
+    if artist is not None and section in artist.sections:
+        return succeed(artist)
+    return _cache(id, section)
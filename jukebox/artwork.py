@@ -0,0 +1,165 @@
+"""Thumbnails of album and artist artwork, fetched once and kept in a size-limited directory so clients don't download full-size images from Google again and again."""
+
+import logging
+import mimetypes
+import os
+import os.path
+from collections import OrderedDict
+from hashlib import sha1
+from urllib.parse import urlparse
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.threads import deferToThread
+from twisted.web.client import Agent, RedirectAgent, readBody
+from .cache import DeferredCache
+from .metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+resizable_hosts = ('googleusercontent.com', 'ggpht.com') # Hosts which resize images when =s<size> is added to the url.
+
+requests = Counter('jukebox_artwork_requests_total', 'Artwork requests, by whether the thumbnail was already stored.', labels = ('result',))
+
+class ArtworkError(Exception):
+    """Artwork could not be fetched."""
+
+def url(kind, id, number = 0):
+    """Return the url which serves thumbnail number of the artwork of the album or artist with the given id."""
+    if number:
+        return '/art/{}/{}?n={}'.format(kind, id, number)
+    return '/art/{}/{}'.format(kind, id)
+
+def resized(url, size):
+    """Return the url of a copy of the image at url no more than size pixels across, or url itself if its host can't resize images."""
+    host = urlparse(url).hostname or ''
+    if not host.endswith(resizable_hosts):
+        return url
+    path, equals, options = url.rpartition('=')
+    if equals and '/' not in options: # Replace any options which are already there.
+        url = path
+    return '%s=s%d' % (url, size)
+
+agent = RedirectAgent(Agent(reactor))
+
+@inlineCallbacks
+def fetch(url):
+    """Fetch url, returning a Deferred which fires with (content type, body)."""
+    response = yield agent.request(b'GET', url.encode())
+    if response.code != 200:
+        raise ArtworkError('%s returned status %d.' % (url, response.code))
+    body = yield readBody(response)
+    content_type = response.headers.getRawHeaders(b'content-type', [b'image/jpeg'])[0].decode()
+    returnValue((content_type, body))
+
+class ArtworkCache:
+    """Thumbnails stored in directory, named after the urls they were fetched from. The least recently used are deleted once they take up more than max_bytes. The directory is only touched in threads, so the reactor never waits on the disk."""
+    def __init__(self, directory = 'artwork_cache', max_bytes = 100 * 1024 * 1024, size = 120, max_age = 30 * 86400, fetch = None, in_thread = deferToThread):
+        """Initialise with the directory, its size limit, the size of thumbnails in pixels, how many seconds clients may keep them for, a function like fetch (the default) to download images with, and a function like deferToThread (the default) to run file operations with. The directory isn't read until it is needed."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.max_age = max_age
+        self.fetch = fetch
+        self.in_thread = in_thread
+        self.files = None # key: (name, bytes) pairs, least recently used first.
+        self.total = 0 # The bytes taken up by files.
+        self.scanning = DeferredCache(lambda: self.in_thread(self.scan), max_size = 0) # Shares the first read of the directory.
+        self.fetching = DeferredCache(self.load, max_size = 0) # Shares fetches which are running at the same time.
+
+    def scan(self):
+        """Read the directory, creating it if it doesn't exist, and return what files should be. Runs in a thread."""
+        os.makedirs(self.directory, exist_ok = True)
+        entries = sorted(os.scandir(self.directory), key = lambda entry: entry.stat().st_mtime)
+        files = OrderedDict()
+        for entry in entries:
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                files[os.path.splitext(entry.name)[0]] = (entry.name, entry.stat().st_size)
+        return files
+
+    @inlineCallbacks
+    def open(self):
+        """Read the directory if it hasn't been read already. Returns a Deferred."""
+        if self.files is not None:
+            return
+        files = yield self.scanning()
+        if self.files is None: # Not opened by another caller while this one waited.
+            self.files = files
+            self.total = sum(size for name, size in files.values())
+            logger.info('Found %d thumbnails taking up %d bytes in %s.', len(self.files), self.total, self.directory)
+
+    def key(self, url):
+        """The name a thumbnail of url is stored under, without an extension."""
+        return sha1(('%s %d' % (url, self.size)).encode()).hexdigest()
+
+    def path(self, name):
+        """The path of the file with the given name."""
+        return os.path.join(self.directory, name)
+
+    @inlineCallbacks
+    def get(self, url):
+        """Return a Deferred which fires with the path of a thumbnail of the image at url, fetching it if it isn't stored."""
+        yield self.open()
+        key = self.key(url)
+        if key in self.files:
+            name = self.files[key][0]
+            self.files.move_to_end(key)
+            try:
+                yield self.in_thread(os.utime, self.path(name)) # So the order survives restarts.
+            except FileNotFoundError:
+                self.forget(key)
+            else:
+                requests.inc(result = 'hit')
+                returnValue(self.path(name))
+        path = yield self.fetching(url)
+        returnValue(path)
+
+    @staticmethod
+    def write(path, body):
+        """Write body to path, replacing the old file only once the new one is complete. Runs in a thread."""
+        with open(path + '.tmp', 'wb') as f:
+            f.write(body)
+        os.replace(path + '.tmp', path)
+
+    @inlineCallbacks
+    def load(self, url):
+        """Fetch and store a thumbnail of url, returning its path."""
+        try:
+            content_type, body = yield (self.fetch or fetch)(resized(url, self.size))
+        except Exception:
+            requests.inc(result = 'error')
+            raise
+        requests.inc(result = 'miss')
+        key = self.key(url)
+        name = key + (mimetypes.guess_extension(content_type.split(';')[0].strip()) or '')
+        path = self.path(name)
+        yield self.in_thread(self.write, path, body)
+        self.forget(key)
+        self.files[key] = (name, len(body))
+        self.total += len(body)
+        yield self.evict()
+        returnValue(path)
+
+    def forget(self, key):
+        """Stop counting the file stored under key, which may not exist."""
+        if key in self.files:
+            self.total -= self.files.pop(key)[1]
+
+    def evict(self):
+        """Forget the least recently used files until there are no more than max_bytes of them, and delete them in a thread. The newest file is never deleted. Returns a Deferred."""
+        names = []
+        while self.total > self.max_bytes and len(self.files) > 1:
+            key, (name, size) = self.files.popitem(last = False)
+            self.total -= size
+            names.append(name)
+        return self.in_thread(self.delete, names)
+
+    def delete(self, names):
+        """Delete the files with the given names. Runs in a thread."""
+        for name in names:
+            try:
+                os.remove(self.path(name))
+            except OSError as e:
+                logger.warning('Failed to delete %s: %s', name, e)
+
+artwork_cache = ArtworkCache()
+Gauge('jukebox_artwork_cache_bytes', 'The bytes taken up by stored thumbnails.', lambda: artwork_cache.total)
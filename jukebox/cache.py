@@ -0,0 +1,49 @@
+"""Caching for functions which return Deferreds."""
+
+from collections import OrderedDict
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed, maybeDeferred
+from twisted.python.failure import Failure
+
+class DeferredCache:
+    """Caches the results of function, which returns a Deferred. At most max_size results are kept, each for ttl seconds. Concurrent calls with the same key share a single call to function. With a ttl or max_size of 0, that is all it does."""
+    def __init__(self, function, max_size = 256, ttl = 300.0, key = None, clock = reactor):
+        """Initialise with the function to cache, the limits, a function to turn arguments into a key (by default the arguments themselves), and the clock to use for expiry."""
+        self.function = function
+        self.max_size = max_size
+        self.ttl = ttl
+        self.key = key or (lambda *args: args)
+        self.clock = clock
+        self.results = OrderedDict() # key: (expires, result) pairs.
+        self.waiting = {} # key: Deferreds waiting on a call which hasn't finished yet.
+
+    def __call__(self, *args):
+        """Get the result for args, returning a Deferred."""
+        key = self.key(*args)
+        if key in self.results:
+            expires, result = self.results[key]
+            if expires > self.clock.seconds():
+                self.results.move_to_end(key)
+                return succeed(result)
+            del self.results[key]
+        d = Deferred()
+        if key in self.waiting:
+            self.waiting[key].append(d)
+        else:
+            self.waiting[key] = [d]
+            maybeDeferred(self.function, *args).addBoth(self.finished, key)
+        return d
+
+    def finished(self, result, key):
+        """Store result if the call succeeded and results are kept, and pass it on to everything waiting for it."""
+        if not isinstance(result, Failure) and self.ttl > 0 and self.max_size > 0:
+            self.results[key] = (self.clock.seconds() + self.ttl, result)
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_size:
+                self.results.popitem(last = False)
+        for d in self.waiting.pop(key):
+            d.callback(result)
+
+    def invalidate(self, *args):
+        """Forget the result for args."""
+        self.results.pop(self.key(*args), None)
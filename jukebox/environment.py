@@ -1,17 +1,86 @@
 """The jinja2 environment."""
 
-import application, os.path
-from jinja2 import Environment, FileSystemLoader
+import application, os, os.path
+from collections import OrderedDict
+from functools import wraps
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 from .app import app
+from .artwork import url as artwork_url
 from .settings import ISettings
+from .result_sets import ResultSet
 from .util import format_timedelta, queue_duration
 
 environment = Environment(
     loader = FileSystemLoader(os.path.join('jukebox', 'templates'))
 )
 
+template_names = ('base.html', 'index.html', 'lyrics.html')
+templates = {} # name: template pairs compiled by configure.
+
+def configure(production = False, cache_dir = None):
+    """
+    Configure the environment.
+    
+    In production mode, every template is compiled straight away and templates are never reloaded from disk.
+    If cache_dir is given, compiled templates are stored there between runs.
+    """
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok = True)
+        environment.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    environment.auto_reload = not production
+    templates.clear()
+    if production:
+        for name in template_names:
+            templates[name] = environment.get_template(name)
+
 environment.filters['format_timedelta'] = format_timedelta
 
+def fragment(dependencies):
+    """
+    Decorate a function which formats a metadata object, so its result is cached on the object.
+    
+    dependencies is called with the object and must return the objects the result depends on, including the object itself. The result is formatted again whenever the version of any of them changes.
+    """
+    def decorator(function):
+        name = function.__name__
+        @wraps(function)
+        def inner(obj):
+            key = tuple(x.version for x in dependencies(obj) if x is not None)
+            cached = obj.fragments.get(name)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            html = function(obj)
+            obj.fragments[name] = (key, html)
+            return html
+        inner.key = lambda obj: (name, obj.id, tuple(x.version for x in dependencies(obj) if x is not None))
+        return inner
+    return decorator
+
+tables = OrderedDict() # key: html pairs for join_fragments.
+max_tables = 256 # The most joined fragments to keep.
+
+def join_fragments(format, objects, separator = '\n'):
+    """Format objects with format, which must be decorated with fragment, joining the results with separator. The joined string is cached until any of the objects change, on objects itself if it is a ResultSet."""
+    if isinstance(objects, ResultSet):
+        name = (format.__name__, separator)
+        key = tuple(format.key(obj) for obj in objects)
+        cached = objects.fragments.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        html = separator.join([format(obj) for obj in objects])
+        objects.fragments[name] = (key, html)
+        return html
+    key = (separator, tuple(format.key(obj) for obj in objects))
+    if key in tables:
+        tables.move_to_end(key)
+        return tables[key]
+    html = separator.join([format(obj) for obj in objects])
+    tables[key] = html
+    while len(tables) > max_tables:
+        tables.popitem(last = False)
+    return html
+
+@fragment(lambda track: [track, track.album] + track.artists)
 def format_track(track):
     """Format a track into a table row: track number, track title, album, artist(s), album art."""
     escape = environment.filters['escape']
@@ -21,33 +90,35 @@ def format_track(track):
         album = '<a class="track-album" id="{}">{}</a>'.format(track.album.id, escape(track.album)) if track.album else '-',
         artists = ', '.join(['<a class="track-artist" id="{0.id}" href="/artist/{0.id}">{0.name}</a>'.format(artist) for artist in track.artists]),
         duration = format_timedelta(track.duration),
-        album_art = '<a href="{0.artwork}" target="_blank"><img src="{0.artwork}" alt="Album art"></a>'.format(track.album) if track.album.artwork is not None else '-',
+        album_art = '<a href="{0.artwork}" target="_blank"><img src="{1}" alt="Album art"></a>'.format(track.album, artwork_url('album', track.album.id)) if track.album is not None and track.album.artwork is not None else '-',
         lyrics = format_lyrics(track)
     )
 
 environment.filters['format_track'] = format_track
 
+@fragment(lambda album: [album] + album.artists[:1])
 def format_album(album):
     """Format an album."""
     escape = environment.filters['escape']
-    return '<span><a class="track-album" id="{0.id}" href="/album/{0.id}">{artist} - {name} ({year})</a></span>{artwork}'.format(
+    return '<span><a class="track-album" id="{0.id}" href="/album/{0.id}">{artist} - {name} ({year})</a> <a class="album-queue" id="{0.id}" href="/queue_album/{0.id}">Queue</a></span>{artwork}'.format(
         album,
         artist = escape(album.artists[0].name if album.artists else 'Unknown Artist'),
         name = escape(album.name),
         year = escape(album.year),
-        artwork = ' <a href="{0}" target="_blank"><img src="{0}" alt="Album art"></a>'.format(album.artwork) if album.artwork else ''
+        artwork = ' <a href="{0}" target="_blank"><img src="{1}" alt="Album art"></a>'.format(album.artwork, artwork_url('album', album.id)) if album.artwork else ''
     )
 
 environment.filters['format_album'] = format_album
 
+@fragment(lambda artist: [artist])
 def format_artist(artist):
     """Format an artist."""
     escape = environment.filters['escape']
     text = '<h4><a class="track-artist" id="{0.id}" href="/artist/{0.id}">{name}</a></h4>'.format(artist, name = escape(artist.name))
     if artist.artwork_urls:
         text += '\n<ul>'
-        for url in artist.artwork_urls:
-            text += '\n<li><a href="{0}" target="_blank"><img src="{0}" alt="Artist artwork"></a></li>'.format(url)
+        for number, url in enumerate(artist.artwork_urls):
+            text += '\n<li><a href="{0}" target="_blank"><img src="{1}" alt="Artist artwork"></a></li>'.format(url, artwork_url('artist', artist.id, number))
         text += '\n</ul>'
     if artist.bio:
         text += '\n<p>{}</p>'.format(str(artist.bio).replace('\n\n', '</p>\n<p>'))
@@ -55,10 +126,11 @@ def format_artist(artist):
 
 environment.filters['format_artist'] = format_artist
 
+@fragment(lambda playlist: [playlist])
 def format_playlist(playlist):
     """Format a playlist."""
     escape = environment.filters['escape']
-    return '<h3><a class="playlist-link" id="{0.id}" href="/playlist/{0.id}">{name}</a></h3>\n<p><pre>{description}</pre></h3>'.format(
+    return '<h3><a class="playlist-link" id="{0.id}" href="/playlist/{0.id}">{name}</a> <a class="playlist-queue" id="{0.id}" href="/queue_playlist/{0.id}">Queue</a></h3>\n<p><pre>{description}</pre></h3>'.format(
         playlist,
         name = escape(playlist.name),
         description = escape(playlist.description)
@@ -83,6 +155,11 @@ environment.globals['tracks_table_header'] = tracks_table_header
 environment.globals['app_name'] = '{0.name} V{0.__version__}'.format(application)
 environment.globals['app'] = app
 
+class LazyDuration:
+    """The duration of the queue, which is only formatted if a template uses it."""
+    def __str__(self):
+        return queue_duration()
+
 def render_template(request, name, *args, **kwargs):
     """
     Render a template and return it as a string.
@@ -92,11 +169,11 @@ def render_template(request, name, *args, **kwargs):
     The following keyword arguments are provided by this function unless overridden:
     session - The session object for the request.
     settings - The ISettings for the session.
-    duration - A timedelta representing the duration of the queue.
+    duration - The duration of the queue, formatted when it is used.
     """
-    template = environment.get_template(name)
+    template = templates.get(name) or environment.get_template(name)
     kwargs.setdefault('request', request)
     kwargs.setdefault('session', request.getSession())
     kwargs.setdefault('settings', ISettings(kwargs['session']))
-    kwargs.setdefault('duration', queue_duration())
+    kwargs.setdefault('duration', LazyDuration())
     return template.render(*args, **kwargs)
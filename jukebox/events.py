@@ -0,0 +1,70 @@
+"""Server-sent events, telling pages when /json has something new for them."""
+
+import logging
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.task import LoopingCall
+
+logger = logging.getLogger(__name__)
+
+class EventStream:
+    """Pushes version numbers to connected pages so they know to fetch /json?since=<version>."""
+    def __init__(self, keepalive = 30.0):
+        """Initialise with the number of seconds between keepalive comments."""
+        self.subscribers = {} # request: session pairs.
+        self.pending = {} # uid: version pairs waiting to be sent. A uid of None means every subscriber.
+        self.flush_call = None # The DelayedCall which will send pending versions.
+        self.keepalive = keepalive
+        self.keepalive_loop = LoopingCall(self.send_keepalive)
+
+    def subscribe(self, request):
+        """Start streaming events to request. Returns a Deferred which never fires, and unsubscribes request when cancelled."""
+        session = request.getSession()
+        request.setHeader('Content-Type', 'text/event-stream')
+        request.setHeader('Cache-Control', 'no-cache')
+        request.write(b'retry: 5000\n\n')
+        self.subscribers[request] = session
+        logger.debug('Subscribed session %s (%d subscribers).', session.uid, len(self.subscribers))
+        if not self.keepalive_loop.running:
+            self.keepalive_loop.start(self.keepalive, now = False)
+        return Deferred(lambda d: self.unsubscribe(request))
+
+    def unsubscribe(self, request):
+        """Stop streaming events to request."""
+        session = self.subscribers.pop(request, None)
+        if session is not None:
+            logger.debug('Unsubscribed session %s (%d subscribers).', session.uid, len(self.subscribers))
+        if not self.subscribers and self.keepalive_loop.running:
+            self.keepalive_loop.stop()
+
+    def publish(self, version, uid = None):
+        """Tell subscribers about version. If uid is given, only that session's pages are told. Versions published during the same reactor iteration are sent together."""
+        self.pending[uid] = max(version, self.pending.get(uid, 0))
+        if self.flush_call is None:
+            self.flush_call = reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """Send pending versions."""
+        self.flush_call = None
+        pending, self.pending = self.pending, {}
+        everyone = pending.pop(None, 0)
+        for request, session in list(self.subscribers.items()):
+            version = max(everyone, pending.get(session.uid, 0))
+            if version:
+                self.send(request, b'data: %d\n\n' % version)
+
+    def send_keepalive(self):
+        """Keep connections and their sessions alive, since pages no longer poll."""
+        for request, session in list(self.subscribers.items()):
+            session.touch()
+            self.send(request, b': keepalive\n\n')
+
+    def send(self, request, data):
+        """Write data to request, dropping it if the connection has gone."""
+        try:
+            request.write(data)
+        except Exception as e:
+            logger.debug('Dropping subscriber: %s', e)
+            self.unsubscribe(request)
+
+event_stream = EventStream()
@@ -0,0 +1,247 @@
+"""
+Stand-ins for Google Play Music and sound_lib, so the jukebox can be load tested without a Google account or a sound card.
+
+They are used instead of the real thing when the JUKEBOX_FAKE environment variable is set before the jukebox is imported.
+"""
+
+import os
+import random
+import time
+from hashlib import md5
+from gmusicapi.exceptions import CallFailure
+from twisted.internet.defer import succeed
+
+enabled = bool(os.environ.get('JUKEBOX_FAKE')) # Whether jukebox.api, jukebox.player and application should use these classes.
+
+words = ('amber', 'bright', 'cinder', 'dusk', 'echo', 'falcon', 'glass', 'harbour', 'ivory', 'juniper', 'kettle', 'lantern', 'meadow', 'north', 'orchid', 'paper')
+
+def number(*parts):
+    """Turn parts into a number which is always the same for the same parts."""
+    return int(md5(':'.join(str(p) for p in parts).encode()).hexdigest()[:8], 16)
+
+def name(n, count = 2):
+    """Make a name of count words from n."""
+    parts = []
+    for x in range(count):
+        parts.append(words[n % len(words)].title())
+        n //= len(words)
+    return ' '.join(parts)
+
+def artist_id(artist):
+    """The id of the given artist number."""
+    return 'Afake%d' % artist
+
+def album_id(artist, album):
+    """The id of the given album of an artist."""
+    return 'Bfake%d-%d' % (artist, album)
+
+def track_id(artist, album, track):
+    """The id of the given track of an album."""
+    return 'Tfake%d-%d-%d' % (artist, album, track)
+
+def parse_id(id, parts):
+    """Split an id made by one of the above functions back into parts numbers, raising ValueError if that isn't possible."""
+    numbers = [int(x) for x in id[5:].split('-')]
+    if not id[1:5] == 'fake' or len(numbers) != parts:
+        raise ValueError(id)
+    return numbers
+
+def duration_millis(id):
+    """The duration of the track with the given id."""
+    return 90000 + number(id, 'duration') % 210000
+
+class FakeClient:
+    """Answers the Mobileclient calls made by the jukebox with generated data, after waiting latency seconds plus up to jitter more."""
+    FROM_MAC_ADDRESS = None
+
+    def __init__(self, latency = 0.0, jitter = 0.0, artists = 1000, albums = 5, tracks = 12):
+        """Initialise with the delays, the number of artists, the number of albums each artist has, and the number of tracks on each album."""
+        self.latency = latency
+        self.jitter = jitter
+        self.artists = artists
+        self.albums = albums
+        self.tracks = tracks
+
+    def __repr__(self):
+        return '{0.__class__.__name__}(latency = {0.latency}, jitter = {0.jitter})'.format(self)
+
+    def login(self, *args, **kwargs):
+        return True
+
+    def wait(self):
+        """Pretend to talk to Google."""
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def parse(self, id, parts, call):
+        """Parse id, raising CallFailure like Google would if it doesn't exist."""
+        try:
+            numbers = parse_id(id, parts)
+        except ValueError:
+            raise CallFailure('No such id: %r.' % id, call)
+        if numbers[0] >= self.artists or numbers[1:2] and numbers[1] >= self.albums or numbers[2:] and numbers[2] >= self.tracks:
+            raise CallFailure('No such id: %r.' % id, call)
+        return numbers
+
+    def random_track(self, seed):
+        """Return the (artist, album, track) numbers of a track chosen by seed."""
+        n = number(seed)
+        return (n % self.artists, (n // self.artists) % self.albums, (n // (self.artists * self.albums)) % self.tracks)
+
+    def track_data(self, artist, album, track):
+        """The data Google would return for a track."""
+        id = track_id(artist, album, track)
+        return {
+            'kind': 'sj#track',
+            'storeId': id,
+            'nid': id,
+            'title': name(number(id), count = 3),
+            'artist': name(artist),
+            'artistId': [artist_id(artist)],
+            'album': name(number(album_id(artist, album))),
+            'albumArtist': name(artist),
+            'albumId': album_id(artist, album),
+            'albumArtRef': [{'url': 'http://localhost/fake/art/%s' % album_id(artist, album)}],
+            'trackNumber': track + 1,
+            'genre': words[artist % len(words)].title(),
+            'durationMillis': str(duration_millis(id)),
+            'year': 1970 + artist % 50
+        }
+
+    def album_data(self, artist, album, include_tracks = True):
+        """The data Google would return for an album."""
+        id = album_id(artist, album)
+        data = {
+            'kind': 'sj#album',
+            'albumId': id,
+            'name': name(number(id)),
+            'artist': name(artist),
+            'albumArtist': name(artist),
+            'artistId': [artist_id(artist)],
+            'albumArtRef': 'http://localhost/fake/art/%s' % id,
+            'year': 1970 + artist % 50
+        }
+        if include_tracks:
+            data['tracks'] = [self.track_data(artist, album, track) for track in range(self.tracks)]
+        return data
+
+    def artist_data(self, artist):
+        """The data Google would return for an artist, without its albums, tracks or related artists."""
+        return {
+            'kind': 'sj#artist',
+            'artistId': artist_id(artist),
+            'name': name(artist),
+            'artistArtRefs': [{'url': 'http://localhost/fake/art/%s' % artist_id(artist)}]
+        }
+
+    def search(self, query, max_results = 50):
+        self.wait()
+        n = number(query.casefold())
+        artists = [(n + x * 7919) % self.artists for x in range(5)]
+        return {
+            'song_hits': [{'track': self.track_data(*self.random_track('%s:%d' % (query, x)))} for x in range(min(max_results, 20))],
+            'artist_hits': [{'artist': self.artist_data(artist)} for artist in artists],
+            'album_hits': [{'album': self.album_data(artist, n % self.albums, include_tracks = False)} for artist in artists],
+            'playlist_hits': [{'playlist': {'shareToken': 'Pfake%d' % ((n + x) % 1000), 'name': name(n + x, count = 3)}} for x in range(3)]
+        }
+
+    def get_track_info(self, store_track_id):
+        self.wait()
+        return self.track_data(*self.parse(store_track_id, 3, 'get_track_info'))
+
+    def get_album_info(self, album_id, include_tracks = True):
+        self.wait()
+        return self.album_data(*self.parse(album_id, 2, 'get_album_info'), include_tracks = include_tracks)
+
+    def get_artist_info(self, artist_id, include_albums = True, max_top_tracks = 5, max_rel_artist = 5):
+        self.wait()
+        artist, = self.parse(artist_id, 1, 'get_artist_info')
+        data = self.artist_data(artist)
+        data['artistBio'] = 'A fake artist, number %d.' % artist
+        if include_albums:
+            data['albums'] = [self.album_data(artist, album, include_tracks = False) for album in range(self.albums)]
+        data['topTracks'] = [self.track_data(artist, x % self.albums, x % self.tracks) for x in range(max_top_tracks)]
+        data['related_artists'] = [self.artist_data((artist + x + 1) % self.artists) for x in range(max_rel_artist)]
+        return data
+
+    def get_shared_playlist_contents(self, share_token):
+        self.wait()
+        return [{'track': self.track_data(*self.random_track('%s:%d' % (share_token, x)))} for x in range(25)]
+
+    def get_station_tracks(self, station_id, num_tracks = 25, recently_played_ids = None):
+        self.wait()
+        return [self.track_data(*self.random_track('%s:%d' % (station_id, x))) for x in range(num_tracks)]
+
+    def get_stream_url(self, song_id, device_id = None, quality = 'hi'):
+        self.wait()
+        self.parse(song_id, 3, 'get_stream_url')
+        return 'fake://%s' % song_id
+
+def fetch_artwork(url):
+    """Stands in for jukebox.artwork.fetch, returning a square of a colour made from url."""
+    colour = number(url) % 0x1000000
+    body = '<svg xmlns="http://www.w3.org/2000/svg" width="120" height="120"><rect width="120" height="120" fill="#%06x"/></svg>' % colour
+    return succeed(('image/svg+xml', body.encode()))
+
+class FakeBassError(Exception):
+    """Stands in for sound_lib.main.BassError."""
+
+class FakeStream:
+    """Stands in for sound_lib.stream.URLStream, playing silently in real time. Lengths and positions are in milliseconds rather than bytes."""
+    def __init__(self, url):
+        """Open the stream for a URL returned by FakeClient.get_stream_url."""
+        if isinstance(url, bytes):
+            url = url.decode()
+        self.length = duration_millis(url[len('fake://'):])
+        self.position = 0 # The position when the stream was last paused.
+        self.started = None # When the stream was last played, or None if it is paused.
+        self.freed = False
+
+    def check(self):
+        if self.freed:
+            raise FakeBassError('The stream has been freed.')
+
+    def play(self):
+        self.check()
+        if self.started is None:
+            self.started = time.time()
+
+    def pause(self):
+        self.check()
+        self.position = self.get_position()
+        self.started = None
+
+    def free(self):
+        self.check()
+        self.freed = True
+
+    def get_length(self):
+        self.check()
+        return self.length
+
+    def get_position(self):
+        self.check()
+        if self.started is None:
+            return self.position
+        return min(self.length, self.position + int((time.time() - self.started) * 1000))
+
+    def bytes_to_seconds(self, position):
+        return position / 1000.0
+
+    @property
+    def is_playing(self):
+        return not self.freed and self.started is not None and self.get_position() < self.length
+
+class FakeOutput:
+    """Stands in for sound_lib.output.Output, with a single device."""
+    device = 1
+
+    def get_device_names(self):
+        return ['Fake output']
+
+    def find_default_device(self):
+        return 1
+
+    def set_device(self, device):
+        self.device = device
@@ -0,0 +1,111 @@
+"""Fetches lyrics in a fixed pool of worker threads."""
+
+import logging
+from itertools import count
+from queue import PriorityQueue
+from threading import Lock, Thread
+from time import monotonic
+from lyricscraper.lyrics import get_lyrics
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
+from twisted.python.failure import Failure
+from .lyrics_store import lyrics_store, normalise, Lyrics
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Priorities, most urgent first.
+PLAYING = 0 # The currently-playing track.
+NEXT = 1 # The next track in the queue.
+REQUESTED = 2 # Someone is waiting on the lyrics page.
+QUEUED = 3 # Anything else in the queue.
+
+scrape_seconds = Histogram('jukebox_lyrics_scrape_seconds', 'How long fetching lyrics took, by whether they were found.', labels = ('result',), buckets = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+class LyricsScheduler:
+    """Fetches lyrics in priority order, fetching each artist and title only once however many times it is asked for. Lyrics found in store are not fetched at all."""
+    def __init__(self, workers = 2, store = lyrics_store):
+        """Initialise with the number of worker threads to start and the LyricsStore to use."""
+        self.workers = workers
+        self.store = store
+        self.threads = []
+        self.jobs = PriorityQueue() # (priority, sequence, key) tuples.
+        self.sequence = count() # Keeps jobs of the same priority in order.
+        self.pending = {} # key: priority pairs for jobs which have not been started.
+        self.running = set() # The keys being fetched right now.
+        self.callbacks = {} # key: callables to be called with the lyrics.
+        self.queries = {} # key: (artist, title) pairs as they were first asked for.
+        self.lock = Lock()
+
+    def start(self, workers = None):
+        """Start the worker threads if they have not already been started."""
+        if workers is not None:
+            self.workers = workers
+        while len(self.threads) < self.workers:
+            thread = Thread(target = self.work, name = 'lyrics-%d' % len(self.threads), daemon = True)
+            self.threads.append(thread)
+            thread.start()
+
+    def schedule(self, artist, title, callback, priority = QUEUED):
+        """Fetch the lyrics for artist and title, calling callback with the result (None if there are no lyrics). The store is read in a thread so SQLite doesn't block the reactor. If the lyrics are stored callback is then called from the reactor thread, otherwise it is called from a worker thread. If the lyrics are already waiting to be fetched, the job is moved up to priority if that is more urgent."""
+        deferToThread(self.store.get, artist, title).addBoth(self.looked_up, artist, title, callback, priority)
+
+    def looked_up(self, result, artist, title, callback, priority):
+        """Call callback with the stored lyrics if result, from LyricsStore.get, found any, otherwise queue a job to fetch them."""
+        if isinstance(result, Failure):
+            logger.warning('Failed to read stored lyrics for %s - %s: %s', artist, title, result.getErrorMessage())
+        else:
+            found, lyrics = result
+            if found:
+                callback(lyrics)
+                return
+        key = (normalise(artist), normalise(title))
+        with self.lock:
+            self.queries.setdefault(key, (artist, title))
+            callbacks = self.callbacks.setdefault(key, [])
+            if callback not in callbacks:
+                callbacks.append(callback)
+            if key in self.running or (key in self.pending and self.pending[key] <= priority):
+                return
+            self.pending[key] = priority
+            self.jobs.put((priority, next(self.sequence), key))
+        self.start()
+
+    def fetch(self, artist, title, priority = REQUESTED):
+        """Return a Deferred which fires with the lyrics for artist and title in the reactor thread."""
+        d = Deferred()
+        self.schedule(artist, title, lambda lyrics: reactor.callFromThread(d.callback, lyrics), priority = priority)
+        return d
+
+    def work(self):
+        """Fetch lyrics forever."""
+        while True:
+            priority, sequence, key = self.jobs.get()
+            with self.lock:
+                if self.pending.get(key) != priority:
+                    continue # This job was rescheduled with a higher priority, and has already been done.
+                del self.pending[key]
+                self.running.add(key)
+                query = self.queries[key]
+            started = monotonic()
+            try:
+                lyrics = Lyrics.from_result(get_lyrics(*query))
+                scrape_seconds.observe(monotonic() - started, result = 'missing' if lyrics is None else 'found')
+                self.store.put(*query, lyrics)
+            except Exception as e:
+                scrape_seconds.observe(monotonic() - started, result = 'error')
+                logger.warning('Failed to get lyrics for %s - %s:', *query)
+                logger.exception(e)
+                lyrics = None
+            with self.lock:
+                self.running.discard(key)
+                del self.queries[key]
+                callbacks = self.callbacks.pop(key, [])
+            for callback in callbacks:
+                try:
+                    callback(lyrics)
+                except Exception as e:
+                    logger.exception(e)
+
+lyrics_scheduler = LyricsScheduler()
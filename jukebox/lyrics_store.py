@@ -0,0 +1,77 @@
+"""An on-disk store of lyrics, including the tracks which don't have any."""
+
+import sqlite3
+from collections import namedtuple
+from threading import Lock
+from time import time
+
+Engine = namedtuple('Engine', ['name'])
+
+class Lyrics(namedtuple('Lyrics', ['engine', 'lyrics'])):
+    """Lyrics as stored. Has the same engine.name and lyrics attributes as the results from lyricscraper."""
+    @classmethod
+    def from_result(cls, result):
+        """Convert a result from lyricscraper.lyrics.get_lyrics, which may be None."""
+        if result is None:
+            return None
+        return cls(Engine(result.engine.name), result.lyrics)
+
+def normalise(text):
+    """Normalise an artist or title so trivially different spellings share a key."""
+    return ' '.join(str(text).casefold().split())
+
+class LyricsStore:
+    """Stores lyrics in an SQLite database. Lyrics expire after ttl seconds, and missing lyrics after miss_ttl seconds."""
+    def __init__(self, path = 'lyrics.db', ttl = 90 * 86400, miss_ttl = 86400):
+        """Initialise with the path to the database and the expiry times. The database is not opened until it is needed."""
+        self.path = path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.db = None
+        self.lock = Lock() # The connection is shared by the reactor and the lyrics threads.
+
+    def connect(self):
+        """Open the database if it isn't already open."""
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread = False)
+            self.db.execute('create table if not exists lyrics (artist text, title text, engine text, lyrics text, fetched real, primary key (artist, title))')
+            self.db.commit()
+        return self.db
+
+    def get(self, artist, title):
+        """Return (found, lyrics). found is False if nothing fresh is stored, otherwise lyrics is the stored Lyrics, or None if the track has none."""
+        with self.lock:
+            row = self.connect().execute('select engine, lyrics, fetched from lyrics where artist = ? and title = ?', (normalise(artist), normalise(title))).fetchone()
+        if row is None:
+            return (False, None)
+        engine, text, fetched = row
+        if text is None:
+            lyrics = None
+            ttl = self.miss_ttl
+        else:
+            lyrics = Lyrics(Engine(engine), text)
+            ttl = self.ttl
+        if fetched + ttl < time():
+            return (False, None)
+        return (True, lyrics)
+
+    def put(self, artist, title, lyrics):
+        """Store lyrics, which may be None if the track has none."""
+        if lyrics is None:
+            engine = text = None
+        else:
+            engine = lyrics.engine.name
+            text = lyrics.lyrics
+        with self.lock:
+            db = self.connect()
+            db.execute('insert or replace into lyrics (artist, title, engine, lyrics, fetched) values (?, ?, ?, ?, ?)', (normalise(artist), normalise(title), engine, text, time()))
+            db.commit()
+
+    def close(self):
+        """Close the database."""
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+lyrics_store = LyricsStore()
@@ -1,20 +1,54 @@
 """Objects representing meta data."""
 
-from threading import Thread
-from lyricscraper.lyrics import get_lyrics
+import pickle
 from datetime import timedelta
+from .lyrics import lyrics_scheduler, QUEUED
+from .registry import Registry
+from .metrics import Gauge
+from .search_index import index
+from .state import next_version
 
-tracks = {}
-artists = {}
-albums = {}
-playlists = {}
+tracks = Registry('tracks')
+artists = Registry('artists')
+albums = Registry('albums')
+playlists = Registry('playlists')
+registries = (tracks, artists, albums, playlists)
+
+for registry in registries:
+    registry.listeners.append(lambda id, kind = registry.name: index.remove(kind, id))
+
+Gauge('jukebox_metadata_objects', 'The number of metadata objects remembered, by kind.', lambda: {(registry.name,): len(registry) for registry in registries}, labels = ('kind',))
+
+def configure(max_size):
+    """Set the maximum size of each registry."""
+    for registry in registries:
+        registry.max_size = max_size
 
 def get_id(d):
     """Get the id from a dictionary d."""
     return d.get('storeId', d.get('nid', d.get('trackId', d.get('id'))))
 
+def fingerprint(data):
+    """Return a value which is the same for equal payloads."""
+    return hash(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+def loaded(obj, key):
+    """Return True if the last payload obj was populated with has the fingerprint key, and every object it refers to is still registered, so populating it again would change nothing."""
+    return obj.fingerprint == key and all(registry_of[type(o)].objects.get(o.id) is o for o in obj.references())
+
+def update(obj, **values):
+    """Set the attributes of obj which differ from values, returning True if any did."""
+    changed = False
+    for name, value in values.items():
+        if getattr(obj, name) != value: # Lists of metadata objects compare by identity.
+            setattr(obj, name, value)
+            changed = True
+    return changed
+
 class Album:
     """An album."""
+    __slots__ = ('id', 'name', 'artists', 'artwork', 'tracks', 'year', 'version', 'fragments', 'fingerprint')
+    
     def __init__(self, data = {}):
         """Initialise with some data."""
         self.id = None
@@ -23,30 +57,37 @@ class Album:
         self.artwork = None
         self.tracks = []
         self.year = None
+        self.version = 0 # Changes whenever this object is populated with new data.
+        self.fragments = {} # name: (key, html) pairs cached by environment.fragment.
+        self.fingerprint = None # The fingerprint of the last payload this object was populated with.
         self.populate(data)
     
     def populate(self, data):
         """Load in some data."""
+        key = fingerprint(data)
+        if loaded(self, key):
+            return
         self.id = data.get('albumId') or self.id
         if self.id is None:
             raise ValueError('No album ID provided in data %r.' % data)
         albums[self.id] = self
-        self.name = data.get('name') or self.name
-        if self.name is None:
-            self.name = 'Unknown Album'
+        changed = update(self, name = data.get('name') or self.name or 'Unknown Album', artwork = data.get('albumArtRef') or self.artwork, year = data.get('year') or self.year or 'Unknown Year')
         if 'artistId' in data:
-            self.artists.clear()
-            for a in data['artistId']:
-                if a: # Skip Various Artists.
-                    self.artists.append(get_artist({'artistId': a, 'name': data.get('artist', data.get('albumArtist')) if a == data['artistId'] else None}))
-        self.artwork = data.get('albumArtRef') or self.artwork
+            changed |= update(self, artists = [get_artist({'artistId': a, 'name': data.get('artist', data.get('albumArtist')) if a == data['artistId'] else None}) for a in data['artistId'] if a]) # Skip Various Artists.
         if 'tracks' in data:
-            self.tracks.clear()
-            for t in data['tracks']:
-                self.tracks.append(get_track(t))
-        self.year = data.get('year') or self.year
-        if self.year is None:
-            self.year = 'Unknown Year'
+            changed |= update(self, tracks = [get_track(t) for t in data['tracks']])
+        if changed:
+            self.version = next_version()
+            self.update_index()
+        self.fingerprint = key
+    
+    def update_index(self):
+        """Index this album under its name and artists."""
+        index.add('albums', self.id, ' '.join([self.name] + [a.name for a in self.artists]))
+    
+    def references(self):
+        """Return the objects this album refers to."""
+        return self.artists + self.tracks
     
     def __str__(self):
         return self.name
@@ -59,13 +100,15 @@ def get_album(data):
     id = data.get('albumId')
     if id in albums:
         album = albums[id]
+        album.populate(data)
     else:
         album = Album(data)
-    album.populate(data)
     return album
 
 class Artist:
     """An artist."""
+    __slots__ = ('id', 'name', 'bio', 'top_tracks', 'artwork_urls', 'albums', 'related_artists', 'sections', 'version', 'fragments', 'fingerprint')
+    
     def __init__(self, data = {}):
         """Initialise with some data."""
         self.id = None
@@ -75,35 +118,47 @@ class Artist:
         self.artwork_urls = []
         self.albums = []
         self.related_artists = []
+        self.sections = set() # The sections in jukebox.artist_sections which have been loaded.
+        self.version = 0 # Changes whenever this object is populated with new data.
+        self.fragments = {} # name: (key, html) pairs cached by environment.fragment.
+        self.fingerprint = None # The fingerprint of the last payload this object was populated with.
         self.populate(data)
     
     def populate(self, data):
         """Populate with some data."""
+        key = fingerprint(data)
+        if loaded(self, key):
+            return
         self.id = data.get('artistId') or self.id
         if self.id is None:
             raise ValueError('No artist ID provided in data %r. Current id is %r.' % (data, self.id))
         artists[self.id] = self
-        self.name = data.get('name') or self.name
-        if self.name is None:
-            self.name = 'Unknown Artist'
-        self.bio = data.get('artistBio') or self.bio
+        changed = update(self, name = data.get('name') or self.name or 'Unknown Artist', bio = data.get('artistBio') or self.bio)
+        if 'artistBio' in data:
+            self.sections.add('header')
         if 'topTracks' in data:
-            self.top_tracks.clear()
-            for t in data['topTracks']:
-                self.top_tracks.append(get_track(t))
+            self.sections.add('top_tracks')
+            changed |= update(self, top_tracks = [get_track(t) for t in data['topTracks']])
         if 'artistArtRefs' in data:
-            self.artwork_urls.clear()
-            for thing in data['artistArtRefs']:
-                self.artwork_urls.append(thing['url'])
+            changed |= update(self, artwork_urls = [thing['url'] for thing in data['artistArtRefs']])
         if 'albums' in data:
-            self.albums.clear()
-            for a in data['albums']:
-                self.albums.append(get_album(a))
+            self.sections.add('albums')
+            changed |= update(self, albums = [get_album(a) for a in data['albums']])
         if 'related_artists' in data:
-            self.related_artists.clear()
-            for a in data['related_artists']:
-                if 'artistId' in a: # Skip Various Artists.
-                    self.related_artists.append(get_artist(a))
+            self.sections.add('related_artists')
+            changed |= update(self, related_artists = [get_artist(a) for a in data['related_artists'] if 'artistId' in a]) # Skip Various Artists.
+        if changed:
+            self.version = next_version()
+            self.update_index()
+        self.fingerprint = key
+    
+    def update_index(self):
+        """Index this artist under its name."""
+        index.add('artists', self.id, self.name)
+    
+    def references(self):
+        """Return the objects this artist refers to."""
+        return self.top_tracks + self.albums + self.related_artists
     
     def __str__(self):
         return self.name
@@ -116,53 +171,78 @@ def get_artist(data):
     id = data.get('artistId')
     if id in artists:
         artist = artists[id]
+        artist.populate(data)
     else:
         artist = Artist(data)
-    artist.populate(data)
     return artist
 
 class Track:
     """A track."""
+    __slots__ = ('id', 'title', 'artists', 'album', 'track_number', 'genre', 'duration_millis', 'lyrics', 'lyrics_fetched', 'version', 'fragments', 'fingerprint')
+    
     def __init__(self, data):
         """Initialise with some data."""
         self.id = None
         self.title = None
         self.artists = []
         self.album = None
-        self.track_umber = None
+        self.track_number = None
         self.genre = None
-        self.duration = None
+        self.duration_millis = None
         self.lyrics = None
+        self.lyrics_fetched = False
+        self.version = 0 # Changes whenever this object is populated with new data.
+        self.fragments = {} # name: (key, html) pairs cached by environment.fragment.
+        self.fingerprint = None # The fingerprint of the last payload this object was populated with.
         self.populate(data)
     
     def populate(self, data):
         """Populate with some data."""
+        key = fingerprint(data)
+        if loaded(self, key):
+            return
         self.id = get_id(data) or self.id
         if self.id is None:
             raise ValueError('No track ID provided in data %r.' % data)
         tracks[self.id] = self
-        self.title = data.get('title') or self.title
-        if self.title is None:
-            self.title = 'Untitled Track'
+        changed = update(self, title = data.get('title') or self.title or 'Untitled Track', track_number = data.get('trackNumber') or self.track_number, genre = data.get('genre') or self.genre or 'No genre')
         if 'artistId' in data:
-            self.artists.clear()
-            for a in data['artistId']:
-                if a: # Skip Various Artists.
-                    self.artists.append(get_artist({'artistId': a, 'name': data.get('artist', 'Unknown Artist') if a == data['artistId'][0] else None}))
+            changed |= update(self, artists = [get_artist({'artistId': a, 'name': data.get('artist', 'Unknown Artist') if a == data['artistId'][0] else None}) for a in data['artistId'] if a]) # Skip Various Artists.
         if 'albumId' in data:
-            self.album = get_album({'albumId': data['albumId'], 'name': data.get('album')})
-        self.track_number = data.get('trackNumber') or self.track_number
-        self.genre = data.get('genre') or self.genre
-        if self.genre is None:
-            self.genre = 'No genre'
+            changed |= update(self, album = get_album({'albumId': data['albumId'], 'name': data.get('album')}))
         if 'durationMillis' in data:
-            self.duration = timedelta(seconds = int(data['durationMillis']) / 1000)
-        Thread(target=self.set_lyrics).start()
+            changed |= update(self, duration_millis = int(data['durationMillis']))
+        if changed:
+            self.version = next_version()
+            self.update_index()
+        self.fingerprint = key
+    
+    def update_index(self):
+        """Index this track under its title and artists."""
+        index.add('tracks', self.id, ' '.join([self.title] + [a.name for a in self.artists]))
+    
+    @property
+    def duration(self):
+        """The duration of this track as a timedelta, or None if it is unknown."""
+        if self.duration_millis is None:
+            return None
+        return timedelta(milliseconds = self.duration_millis)
+    
+    def references(self):
+        """Return the objects this track refers to."""
+        if self.album is None:
+            return self.artists
+        return self.artists + [self.album]
     
-    def set_lyrics(self):
+    def fetch_lyrics(self, priority = QUEUED):
+        """Schedule the lyrics for this track to be fetched, if they haven't been already."""
+        if self.artists and not self.lyrics_fetched:
+            lyrics_scheduler.schedule(self.artists[0].name, self.title, self.set_lyrics, priority = priority)
+    
+    def set_lyrics(self, lyrics):
         """Set the lyrics for this track."""
-        if self.artists:
-            self.lyrics = get_lyrics(self.artists[0].name, self.title)
+        self.lyrics = lyrics
+        self.lyrics_fetched = True
     
     def __str__(self):
         return self.title
@@ -175,37 +255,50 @@ def get_track(data):
     id = get_id(data)
     if id in tracks:
         track = tracks[id]
+        track.populate(data)
     else:
         track = Track(data)
-    track.populate(data)
     return track
 
 class Playlist:
     """A playlist."""
+    __slots__ = ('id', 'name', 'description', 'tracks', 'version', 'fragments', 'fingerprint')
+    
     def __init__(self, data):
         """Initialise the playlist."""
         self.id = None
         self.name = None
         self.description = None
         self.tracks = []
+        self.version = 0 # Changes whenever this object is populated with new data.
+        self.fragments = {} # name: (key, html) pairs cached by environment.fragment.
+        self.fingerprint = None # The fingerprint of the last payload this object was populated with.
         self.populate(data)
     
     def populate(self, data):
         """Populate with data."""
+        key = fingerprint(data)
+        if loaded(self, key):
+            return
         self.id = data.get('shareToken') or self.id
         if self.id is None:
             raise ValueError('No share token found in data %r.' % data)
         playlists[self.id] = self
-        self.name = data.get('name') or self.name
-        if self.name is None:
-            self.name = 'Untitled Playlist'
-        self.description = data.get('description') or self.description
-        if self.description is None:
-            self.description = 'No description available.'
+        changed = update(self, name = data.get('name') or self.name or 'Untitled Playlist', description = data.get('description') or self.description or 'No description available.')
         if 'tracks' in data:
-            self.tracks.clear()
-            for t in data.get('tracks', []):
-                self.tracks.append(get_track(t['track']))
+            changed |= update(self, tracks = [get_track(t['track']) for t in data['tracks']])
+        if changed:
+            self.version = next_version()
+            self.update_index()
+        self.fingerprint = key
+    
+    def update_index(self):
+        """Index this playlist under its name."""
+        index.add('playlists', self.id, self.name)
+    
+    def references(self):
+        """Return the objects this playlist refers to."""
+        return self.tracks
     
     def __str__(self):
         return self.name
@@ -218,7 +311,9 @@ def get_playlist(data):
     id = data.get('shareToken')
     if id in playlists:
         playlist = playlists[id]
+        playlist.populate(data)
     else:
         playlist = Playlist(data)
-    playlist.populate(data)
     return playlist
+
+registry_of = {Album: albums, Artist: artists, Track: tracks, Playlist: playlists} # type: registry pairs, used to check the objects an object refers to haven't been evicted.
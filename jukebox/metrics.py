@@ -0,0 +1,201 @@
+"""Counters, gauges and histograms, served at /metrics in the Prometheus text format."""
+
+import logging
+from functools import wraps
+from threading import Lock
+from time import monotonic
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, CancelledError
+from twisted.python.failure import Failure
+
+logger = logging.getLogger(__name__)
+
+metrics = [] # Every metric, in the order they are rendered.
+
+content_type = b'text/plain; version=0.0.4; charset=utf-8'
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape(value):
+    """Escape a label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(pairs):
+    """Format (name, value) pairs as a set of labels."""
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+def format_value(value):
+    """Format a sample value."""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class Metric:
+    """The base class for metrics, which may be split by the values of labels."""
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels = (), registry = metrics):
+        """Initialise with the name of the metric, a description, the names of its labels, and the list of metrics to add it to."""
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = Lock() # Metrics are updated from threads other than the reactor's.
+        registry.append(self)
+
+    def key(self, labels):
+        """Turn the labels passed to an update into a tuple of values."""
+        if set(labels) != set(self.labels):
+            raise ValueError('%s has labels %r, not %r.' % (self.name, self.labels, tuple(labels)))
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        """Yield (suffix, label pairs, value) tuples."""
+        raise NotImplementedError
+
+    def render(self):
+        """Return the lines for this metric."""
+        lines = ['# HELP %s %s' % (self.name, self.help.replace('\\', '\\\\').replace('\n', '\\n')), '# TYPE %s %s' % (self.name, self.kind)]
+        for suffix, pairs, value in self.samples():
+            lines.append('%s%s%s %s' % (self.name, suffix, format_labels(pairs), format_value(value)))
+        return lines
+
+class Counter(Metric):
+    """A value which only goes up."""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {} # label values: count pairs.
+
+    def inc(self, amount = 1, **labels):
+        """Add amount to the count for labels."""
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield ('', list(zip(self.labels, key)), value)
+
+class Gauge(Metric):
+    """A value which is read when the metrics are rendered."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, function, labels = (), registry = metrics):
+        """Initialise with a function which returns the value, or a dictionary of label values: value pairs if there are labels."""
+        super().__init__(name, help, labels = labels, registry = registry)
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        if not self.labels:
+            yield ('', [], value)
+            return
+        for key, value in sorted(value.items()):
+            yield ('', list(zip(self.labels, key)), value)
+
+class Histogram(Metric):
+    """Counts of observations falling into buckets, such as the durations of requests."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels = (), buckets = default_buckets, registry = metrics):
+        """Initialise with the upper bounds of the buckets, which are cumulative as Prometheus expects."""
+        super().__init__(name, help, labels = labels, registry = registry)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.values = {} # label values: [bucket counts, sum] pairs.
+
+    def observe(self, value, **labels):
+        """Record an observation."""
+        key = self.key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [[0] * len(self.buckets), 0.0]
+            counts = self.values[key][0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+            self.values[key][1] += value
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in values:
+            pairs = list(zip(self.labels, key))
+            for bound, count in zip(self.buckets, counts):
+                yield ('_bucket', pairs + [('le', format_value(bound))], count)
+            yield ('_sum', pairs, total)
+            yield ('_count', pairs, counts[-1])
+
+def render(registry = metrics):
+    """Render every metric in registry."""
+    lines = []
+    for metric in registry:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            logger.warning('Failed to render metric %s:', metric.name)
+            logger.exception(e)
+    return '\n'.join(lines) + '\n'
+
+requests = Counter('jukebox_requests_total', 'Requests finished, by route and response code.', labels = ('route', 'code'))
+request_seconds = Histogram('jukebox_request_seconds', 'How long requests took to finish, by route.', labels = ('route',))
+
+def timed(route):
+    """Decorate a route so its requests are counted and timed, including the time taken for any Deferred it returns to fire."""
+    def decorator(function):
+        @wraps(function)
+        def inner(request, *args, **kwargs):
+            started = monotonic()
+            def finished(result):
+                if isinstance(result, Failure) and not result.check(CancelledError): # Cancelled requests have been disconnected, not failed.
+                    code = 500
+                else:
+                    code = getattr(request, 'code', 200)
+                requests.inc(route = route, code = code)
+                request_seconds.observe(monotonic() - started, route = route)
+                return result
+            try:
+                result = function(request, *args, **kwargs)
+            except Exception:
+                finished(Failure())
+                raise
+            if isinstance(result, Deferred):
+                return result.addBoth(finished)
+            return finished(result)
+        return inner
+    return decorator
+
+class LagMonitor:
+    """Measures how late the reactor runs a call scheduled interval seconds ahead, which is how long anything else would have been kept waiting."""
+    def __init__(self, interval = 0.5):
+        """Initialise with the number of seconds between measurements."""
+        self.interval = interval
+        self.expected = None # When the pending call should happen.
+        self.lag = 0.0 # The lag measured by the last call.
+        self.call = None # The pending DelayedCall.
+
+    def start(self, interval = None):
+        """Start measuring."""
+        if interval is not None:
+            self.interval = interval
+        if self.call is None or not self.call.active():
+            self.schedule()
+
+    def schedule(self):
+        """Schedule the next measurement."""
+        self.expected = reactor.seconds() + self.interval
+        self.call = reactor.callLater(self.interval, self.measure)
+
+    def measure(self):
+        """Record how late this call is, and schedule the next one."""
+        self.lag = max(0.0, reactor.seconds() - self.expected)
+        reactor_lag.observe(self.lag)
+        self.schedule()
+
+lag_monitor = LagMonitor()
+reactor_lag = Histogram('jukebox_reactor_lag_seconds', 'How late the reactor ran calls scheduled by the lag monitor.', buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+Gauge('jukebox_reactor_lag_last_seconds', 'The reactor lag measured most recently.', lambda: lag_monitor.lag)
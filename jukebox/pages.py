@@ -1,54 +1,98 @@
 """Jukebox app routes."""
 
-from math import floor
-from sound_lib.main import BassError
+import logging
+from heapq import nsmallest
+from inspect import unwrap
 from gmusicapi.exceptions import CallFailure
 from .app import app
-from .api import api
-from .environment import render_template, format_track, format_artist, format_album, format_playlist, tracks_table_header, environment
+from .player import player
+from .api import async_api
+from .environment import render_template, format_track, format_artist, format_album, format_playlist, join_fragments, tracks_table_header, environment
 from .search_form import SearchForm
 from .util import convert, queue_duration
 from .settings import ISettings
-from . import metadata
-from lyricscraper.lyrics import get_lyrics as _get_lyrics
+from .events import event_stream
+from .search import search as cached_search
+from .search_index import index
+from . import metadata, artist_sections
+from .lyrics import lyrics_scheduler
+from .result_sets import get_result_set, materialise
+from . import metrics
+from .artwork import artwork_cache, url as artwork_url
+from .responses import conditional, not_modified, boot
+from .watchdog import watchdog, routes as watched_routes
 from urllib.parse import unquote
+from hashlib import md5
+from os.path import basename
 from multidict import MultiDict
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, TimeoutError, DeferredList
+from twisted.web.static import File
 from json import dumps
 
+logger = logging.getLogger(__name__)
+
 localhost = '127.0.0.1'
+suggestion_limit = 10 # The most suggestions of each kind returned by /suggest.
+max_queue_ids = 100 # The most ids /queue_tracks accepts, so one request can't start hundreds of calls to Google.
+page_cache_control = 'private, no-cache' # Sent with pages and /json, which depend on the session and must be checked every time.
+
+def route(url, *args, **kwargs):
+    """Like app.route, but requests are counted and timed for /metrics, and blamed by the watchdog."""
+    def decorator(function):
+        watched_routes[unwrap(function).__code__] = url
+        return app.route(url, *args, **kwargs)(metrics.timed(url)(function))
+    return decorator
 
 def default_render(request, **kwargs):
-    """The default template."""
+    """The default template, or an empty 304 response if the client already has it."""
     kwargs.setdefault('form', SearchForm())
-    return render_template(
+    html = render_template(
         request,
         'index.html',
         **kwargs
     )
+    if conditional(request, md5(html.encode()).hexdigest(), page_cache_control): # Everything which changes is loaded from /json, so the page rarely does.
+        return b''
+    return html
+
+def show_tracks(settings, tracks, header, rest = None):
+    """
+    Show the ResultSet tracks in the tracks table under header, starting at the first page.
+    
+    If tracks is only the start of the results, rest is a Deferred from result_sets.materialise which fires with all of them. They are shown when it fires, unless the session has moved on to something else by then.
+    """
+    settings.tracks_page = 0
+    settings.tracks = tracks
+    if rest is None:
+        settings.tracks_header = header
+        return
+    settings.tracks_header = header + ' (loading...)'
+    def loaded(everything):
+        if settings.tracks is tracks:
+            settings.tracks = everything
+            settings.tracks_header = header
+        return everything
+    rest.addCallback(loaded)
+    rest.addErrback(lambda failure: logger.warning('Failed to load %s: %s', header, failure.getErrorMessage()))
 
+@inlineCallbacks
 def _search(request, search):
     """Perform a low-level search."""
-    results = api.search(search)
     settings = ISettings(request.getSession())
-    settings.tracks_header = 'Track Results'
+    try:
+        results = yield cached_search(search)
+    except TimeoutError:
+        settings.message = 'The search timed out.'
+        return
     settings.artist = None
     settings.album = None
     settings.playlist = None
-    settings.tracks.clear()
-    for s in results.get('song_hits', []):
-        settings.tracks.append(metadata.get_track(s['track']))
-    settings.artists.clear()
-    for a in results.get('artist_hits', []):
-        settings.artists.append(metadata.get_artist(a['artist']))
-    settings.albums.clear()
-    for a in results.get('album_hits', []):
-        settings.albums.append(metadata.get_album(a['album']))
-    settings.playlists.clear()
-    for p in results.get('playlist_hits', []):
-        settings.playlists.append(metadata.get_playlist(p['playlist']))
-
-@app.route('/')
+    show_tracks(settings, results.tracks, 'Track Results')
+    settings.artists = results.artists
+    settings.albums = results.albums
+    settings.playlists = results.playlists
+
+@route('/')
 @inlineCallbacks
 def home(request):
     """Home page."""
@@ -72,25 +116,46 @@ def home(request):
         )
     )
 
-@app.route('/artist/<id>')
+@route('/artist/<id>')
 @inlineCallbacks
 def get_artist(request, id):
-    """Render an artist to the home page."""
+    """Render an artist to the home page. Only the name, artwork and bio are loaded; the other sections are loaded when they are asked for."""
     settings = ISettings(request.getSession())
     settings.artist = None
     settings.playlist = None
     settings.album = None
     try:
-        artist = yield api.get_artist_info(id)
-        artist = metadata.get_artist(artist)
-        settings.artist = artist
-    except CallFailure:
+        settings.artist = yield artist_sections.load(id)
+    except (CallFailure, TimeoutError):
         settings.message = 'No artist with that ID.'
     returnValue(
         default_render(request)
     )
 
-@app.route('/album/<id>')
+@route('/artist/<id>/<section>')
+@inlineCallbacks
+def get_artist_section(request, id, section):
+    """Load a section of an artist, showing the artist if it isn't already shown."""
+    settings = ISettings(request.getSession())
+    if section not in artist_sections.sections:
+        request.setResponseCode(404)
+        returnValue('No such section.')
+    try:
+        artist = yield artist_sections.load(id, section)
+    except (CallFailure, TimeoutError):
+        settings.message = 'Failed to load the {} of that artist.'.format(section.replace('_', ' '))
+    else:
+        if settings.artist is artist:
+            settings.versions.touch('artist')
+        else:
+            settings.playlist = None
+            settings.album = None
+            settings.artist = artist
+    returnValue(
+        default_render(request)
+    )
+
+@route('/album/<id>')
 @inlineCallbacks
 def get_album(request, id):
     """Get an album and render it to the home page."""
@@ -100,31 +165,28 @@ def get_album(request, id):
     settings.album = None
     try:
         print('Album: %r.' % id)
-        album = yield api.get_album_info(id)
+        album = yield async_api.get_album_info(id)
         settings.album = metadata.get_album(album)
-        settings.tracks_header = str(environment.filters['escape'](settings.album.name))
-        settings.tracks = settings.album.tracks
-    except CallFailure:
-        settings.tracks_header = 'Unknown Album'
-        settings.tracks = []
+        show_tracks(settings, get_result_set('tracks', settings.album.tracks), str(environment.filters['escape'](settings.album.name)))
+    except (CallFailure, TimeoutError):
+        show_tracks(settings, get_result_set('tracks', ()), 'Unknown Album')
         settings.message = 'No album with that ID.'
     returnValue(
         default_render(request)
     )
 
-@app.route('/queue_track/<id>')
+@route('/queue_track/<id>')
 @inlineCallbacks
 def queue_track(request, id):
     """Queue the requested track."""
     settings = ISettings(request.getSession())
     try:
-        track = yield api.get_track_info(id)
+        track = yield async_api.get_track_info(id)
         track = metadata.get_track(track)
-        queued = (track is app.track) or (track in app.queue)
+        queued = (track is app.playback.track) or not app.queue.append(track, owner = request.getSession().uid)
         if not queued:
-            app.queue.append(track)
-            app.owners[track] = request.getSession().uid
-    except CallFailure:
+            track.fetch_lyrics()
+    except (CallFailure, TimeoutError):
         track = None
         queued = False
     if track:
@@ -138,7 +200,90 @@ def queue_track(request, id):
         default_render(request)
     )
 
-@app.route('/delete_track/<id>')
+def enqueue(request, tracks, source):
+    """Queue every track in tracks which isn't already queued or playing, in one go. Returns a json summary."""
+    settings = ISettings(request.getSession())
+    added = app.queue.extend([track for track in tracks if track is not app.playback.track], owner = request.getSession().uid)
+    for track in added:
+        track.fetch_lyrics()
+    settings.message = '{} of {} tracks from {} were added to the play queue.'.format(len(added), len(tracks), source)
+    request.setHeader(b'Content-Type', b'application/json')
+    return dumps({'queued': len(added), 'skipped': len(tracks) - len(added)})
+
+def enqueue_failed(request, message, code = 404):
+    """Tell the session nothing could be queued. Returns a json error."""
+    ISettings(request.getSession()).message = message
+    request.setResponseCode(code)
+    request.setHeader(b'Content-Type', b'application/json')
+    return dumps({'error': message})
+
+@inlineCallbacks
+def resolve_tracks(ids):
+    """Return a Deferred which fires with the tracks with the given ids. Known tracks are used as they are, and the rest are fetched concurrently. Tracks which can't be fetched are left out."""
+    found = {id: metadata.tracks.get(id) for id in ids}
+    missing = [id for id, track in found.items() if track is None]
+    results = yield DeferredList([async_api.get_track_info(id) for id in missing], consumeErrors = True)
+    for id, (success, data) in zip(missing, results):
+        if success:
+            found[id] = metadata.get_track(data)
+    returnValue([found[id] for id in ids if found[id] is not None])
+
+@route('/queue_tracks')
+@inlineCallbacks
+def queue_tracks(request):
+    """Queue the tracks given as ?id=<id>&id=<id>..."""
+    ids = list(dict.fromkeys(convert(id) for id in request.args.get(b'id', []))) # Without duplicates, in order.
+    if len(ids) > max_queue_ids:
+        returnValue(enqueue_failed(request, 'No more than {} tracks can be queued at once.'.format(max_queue_ids), code = 400))
+    tracks = yield resolve_tracks(ids)
+    if not tracks:
+        returnValue(enqueue_failed(request, 'No tracks found with those ids.'))
+    returnValue(enqueue(request, tracks, 'your selection'))
+
+@route('/queue_album/<id>')
+@inlineCallbacks
+def queue_album(request, id):
+    """Queue every track on an album, only asking Google for it if its tracks aren't already known."""
+    album = metadata.albums.get(id)
+    if album is None or not album.tracks:
+        try:
+            data = yield async_api.get_album_info(id)
+        except (CallFailure, TimeoutError):
+            returnValue(enqueue_failed(request, 'No album with that ID.'))
+        album = metadata.get_album(data)
+    returnValue(enqueue(request, album.tracks, album))
+
+@route('/queue_playlist/<id>')
+@inlineCallbacks
+def queue_playlist(request, id):
+    """Queue every track in a playlist, only asking Google for it if its tracks aren't already known."""
+    playlist = metadata.playlists.get(id)
+    if playlist is None or not playlist.tracks:
+        try:
+            data = yield async_api.get_shared_playlist_contents(id)
+        except (CallFailure, TimeoutError):
+            returnValue(enqueue_failed(request, 'Failed to get tracks for the playlist with that ID.'))
+        tracks, rest = materialise('tracks', [t['track'] for t in data], metadata.get_track)
+        if rest is not None:
+            tracks = yield rest
+        playlist = metadata.get_playlist({'shareToken': id}) # Only remembered once its tracks are known.
+        playlist.tracks = list(tracks)
+    returnValue(enqueue(request, playlist.tracks, playlist))
+
+@route('/queue_station/<id>')
+@inlineCallbacks
+def queue_station(request, id):
+    """Queue the tracks from a station."""
+    try:
+        station = yield async_api.get_station_tracks(id)
+    except (CallFailure, TimeoutError):
+        returnValue(enqueue_failed(request, 'No station with that ID.'))
+    tracks, rest = materialise('tracks', station, metadata.get_track)
+    if rest is not None:
+        tracks = yield rest
+    returnValue(enqueue(request, tracks, 'the station'))
+
+@route('/delete_track/<id>')
 def delete_track(request, id):
     """Delete a track from the queue. Only the person who queued the track can do this."""
     settings = ISettings(request.getSession())
@@ -146,12 +291,9 @@ def delete_track(request, id):
         track = metadata.tracks[id]
     else:
         track = None
-    owner = app.owners.get(track)
+    owner = app.queue.owner(id)
     if owner == request.getSession().uid or request.transport.getHost().host == localhost:
-        if track in app.queue:
-            app.queue.remove(track)
-            if track in app.owners:
-                del app.owners[track]
+        if app.queue.remove(id) is not None:
             settings.message = '{} was removed from the play queue.'.format(track)
         else:
             settings.message = '{} was not removed from the play queue.'.format(track if track is not None else 'Nothing')
@@ -159,13 +301,13 @@ def delete_track(request, id):
         settings.message = 'You do not have permission to remove this track from the play queue.'
     return default_render(request)
 
-@app.route('/lyrics/<artist>/<title>')
+@route('/lyrics/<artist>/<title>')
 @inlineCallbacks
 def get_lyrics(request, artist, title):
     """Get the lyrics for a particular track."""
     artist = unquote(artist)
     title = unquote(title)
-    lyrics = yield _get_lyrics(artist, title)
+    lyrics = yield lyrics_scheduler.fetch(artist, title)
     returnValue(
         render_template(
             request,
@@ -176,24 +318,19 @@ def get_lyrics(request, artist, title):
         )
     )
 
-@app.route('/skip')
+@route('/skip')
 def skip(request):
     """Skip the currently playing track."""
     settings = ISettings(request.getSession())
-    if app.stream and (request.getSession().uid == app.owner or request.transport.getHost().host == localhost):
-        try:
-            app.stream.pause()
-        except BassError:
-            pass
-        app.stream = None
-        app.owner = None
-        app.track = None
+    playback = app.playback
+    if playback.track is not None and (request.getSession().uid == playback.owner or request.transport.getHost().host == localhost):
+        player.stop()
         settings.message = 'Track skipped.'
     else:
         settings.message = 'Not skipping.'
     return default_render(request)
 
-@app.route('/station/<id>')
+@route('/station/<id>')
 @inlineCallbacks
 def get_station(request, id):
     """Get the station with the given ID."""
@@ -202,32 +339,52 @@ def get_station(request, id):
     settings.playlist = None
     settings.album = None
     try:
-        station = yield api.get_station_tracks(id)
-        settings.tracks = [metadata.get_track(x) for x in station]
-    except CallFailure:
-        settings.tracks = []
+        station = yield async_api.get_station_tracks(id)
+    except (CallFailure, TimeoutError):
+        show_tracks(settings, get_result_set('tracks', ()), 'Unknown Station')
+    else:
+        tracks, rest = materialise('tracks', station, metadata.get_track)
+        show_tracks(settings, tracks, 'Station', rest)
     returnValue(default_render(request))
 
-@app.route('/playlist/<id>')
+@route('/playlist/<id>')
 @inlineCallbacks
 def get_playlist(request, id):
-    """Get a playlist."""
+    """Get a playlist, showing its tracks in the tracks table. Long playlists are shown a page at a time while the rest are loaded in the background."""
     settings = ISettings(request.getSession())
     settings.artist = None
-    settings.playlist = metadata.get_playlist({'shareToken': id})
+    playlist = metadata.get_playlist({'shareToken': id})
+    settings.playlist = playlist
     settings.album = None
+    header = playlist.name # The client sets the header as text, so it mustn't be escaped.
     try:
-        data = yield api.get_shared_playlist_contents(id)
-        settings.playlist.tracks.clear()
-        for t in data:
-            settings.playlist.tracks.append(metadata.get_track(t['track']))
-    except CallFailure:
+        data = yield async_api.get_shared_playlist_contents(id)
+    except (CallFailure, TimeoutError):
         settings.message = 'Failed to get tracks for the playlist with that ID.' # Playlist will have old tracks or none at all.
+        show_tracks(settings, get_result_set('tracks', playlist.tracks), header)
+    else:
+        def loaded(everything):
+            playlist.tracks = list(everything)
+            return everything
+        tracks, rest = materialise('tracks', [t['track'] for t in data], metadata.get_track)
+        if rest is None:
+            loaded(tracks)
+        else:
+            rest.addCallback(loaded)
+        show_tracks(settings, tracks, header, rest)
     returnValue(
         default_render(request)
     )
 
-@app.route('/modern_search/<string>')
+@route('/tracks/page/<int:number>')
+def tracks_page(request, number):
+    """Show a different page of the tracks table."""
+    settings = ISettings(request.getSession())
+    settings.tracks_page = max(0, number)
+    settings.versions.touch('tracks')
+    return default_render(request)
+
+@route('/modern_search/<string>')
 @inlineCallbacks
 def modern_search(request, string):
     """Perform an inline search."""
@@ -235,68 +392,243 @@ def modern_search(request, string):
         yield _search(request, string)
     returnValue(None)
 
-@app.route('/json')
-def get_json(request):
-    """Get the contents of settings as json."""
-    escape = environment.filters['escape']
-    d = {}
-    settings = ISettings(request.getSession())
-    if app.track is None:
-        d['now_playing'] = '<p>Nothing Playing</p>'
-        d['progress'] = 0
-        d['lyrics'] = d['now_playing']
-    else:
-        d['now_playing'] = '<p>{0} | <a class="track-skip" href="/skip">Skip</a></p>\n<h3>By</h3>{artists}'.format(
-            app.track,
-            artists = '\n'.join([format_artist(a) for a in app.track.artists])
+def render_now_playing(settings):
+    """Render the currently-playing track and its artists."""
+    track = app.playback.track
+    if track is None:
+        return '<p>Nothing Playing</p>'
+    return '<p>{0} | <a class="track-skip" href="/skip">Skip</a></p>\n<h3>By</h3>{artists}'.format(
+        track,
+        artists = join_fragments(format_artist, track.artists)
+    )
+
+def render_progress(settings):
+    """Return the progress through the current track."""
+    return app.playback.progress
+
+def render_lyrics(settings):
+    """Render the lyrics for the current track."""
+    track = app.playback.track
+    if track is None:
+        return render_now_playing(settings)
+    lyrics = track.lyrics
+    if lyrics is None:
+        return '<p>No lyrics found.</p>'
+    return '<h3>Engine: {}</h3><p>{}</p>'.format(
+        lyrics.engine.name,
+        lyrics.lyrics.replace('\n\n', '</p><p>').replace('\n', '<br>')
+    )
+
+def render_tracks(settings):
+    """Render the page of the tracks table being shown, with links to the other pages."""
+    if not settings.tracks:
+        return '<p>No track results.</p>'
+    count = settings.tracks.page_count()
+    number = min(settings.tracks_page, count - 1)
+    text = tracks_table_header + join_fragments(format_track, settings.tracks.page(number)) + '\n</table>'
+    if count > 1:
+        text += '\n<p>{previous}Page {page} of {count}{next}</p>'.format(
+            previous = '<a class="track-page" id="{}" href="#">Previous</a> | '.format(number - 1) if number > 0 else '',
+            page = number + 1,
+            count = count,
+            next = ' | <a class="track-page" id="{}" href="#">Next</a>'.format(number + 1) if number < count - 1 else ''
         )
-        d['progress'] = floor((100.0 / (app.stream.get_length() - 1)) * app.stream.get_position())
-        lyrics = app.track.lyrics
-        if lyrics is None:
-            d['lyrics'] = '<p>No lyrics found.</p>'
-        else:
-            d['lyrics'] = '<h3>Engine: {}</h3><p>{}</p>'.format(
-                lyrics.engine.name,
-                lyrics.lyrics.replace('\n\n', '</p><p>').replace('\n', '<br>')
-            )
-    if settings.tracks:
-        d['tracks'] = tracks_table_header + '\n'.join([format_track(t) for t in settings.tracks]) + '\n</table>'
-    else:
-        d['tracks'] = '<p>No track results.</p>'
-    d['artists'] = '\n'.join([format_artist(a) for a in settings.artists]) or '<p>No artist results.</p>'
+    return text
+
+def render_artists(settings):
+    """Render the artist results."""
+    return join_fragments(format_artist, settings.artists) or '<p>No artist results.</p>'
+
+def render_albums(settings):
+    """Render the album results."""
     if settings.albums:
         text = '<ul>\n<li>'
-        text += '</li>\n<li>'.join([format_album(a) for a in settings.albums])
+        text += join_fragments(format_album, settings.albums, '</li>\n<li>')
         text += '</li>\n</ul>'
     else:
         text = '<p>No album results.</p>'
-    d['albums'] = text
-    d['playlists'] = '\n'.join([format_playlist(p) for p in settings.playlists]) or '<p>No playlist results.</p>'
-    d['message'] = settings.message
-    d['tracks_header'] = settings.tracks_header
-    if settings.artist:
-        text = format_artist(settings.artist)
-        text += '\n<h3>Top Tracks</h3>\n'
-        text += tracks_table_header
-        text += '\n'.join([format_track(t) for t in settings.artist.top_tracks])
-        text += '\n</table>'
-        text += '\n<h3>Albums</h3>\n'
-        text += '\n'.join([format_album(a) for a in settings.artist.albums])
-        text += '\n<h3>Related Artists</h3>\n'
-        text += '\n'.join([format_artist(a) for a in settings.artist.related_artists])
-    else:
-        text = None
-    d['artist'] = text
-    if app.queue:
-        text = '<li>\n'
-        text += '\n'.join(['<li>{artist} - {title} {album_art}{delete}</li>'.format(
-            artist = escape(track.artists[0].name) if track.artists else 'Unknown Artist',
-            title = escape(track.title),
-            album_art = '<a href="{0}" target="_blank"><img str="{0}" alt="Album art"></a> '.format(track.artists[0].artwork_urls[0]) if track.artists and track.artists[0].artwork_urls else '',
-            delete = '<a class="track-delete" id="{0.id}">Delete</a>'.format(track)
-        ) for track in app.queue])
-        text += '\n</ul>\n<p>Duration: %s.</p>' % queue_duration()
-        d['queue'] = text
-    else:
-        d['queue'] = '<p>The play queue is empty.</p>'
+    return text
+
+def render_playlists(settings):
+    """Render the playlist results."""
+    return join_fragments(format_playlist, settings.playlists) or '<p>No playlist results.</p>'
+
+# The sections of the artist view after the header: (section, heading, function to render the loaded section).
+artist_view = (
+    ('top_tracks', 'Top Tracks', lambda artist: tracks_table_header + join_fragments(format_track, artist.top_tracks) + '\n</table>'),
+    ('albums', 'Albums', lambda artist: join_fragments(format_album, artist.albums)),
+    ('related_artists', 'Related Artists', lambda artist: join_fragments(format_artist, artist.related_artists))
+)
+
+def render_artist(settings):
+    """Render the currently-focused artist, with links to load the sections which haven't been loaded."""
+    artist = settings.artist
+    if not artist:
+        return None
+    text = format_artist(artist)
+    for section, heading, render in artist_view:
+        text += '\n<h3>{}</h3>\n'.format(heading)
+        if section in artist.sections:
+            text += render(artist)
+        else:
+            text += '<p><a class="artist-section" id="{0}/{1}" href="/artist/{0}/{1}">Show {2}</a></p>'.format(artist.id, section, heading.lower())
+    return text
+
+def render_queue(settings):
+    """Render the play queue."""
+    if not app.queue:
+        return '<p>The play queue is empty.</p>'
+    escape = environment.filters['escape']
+    text = '<li>\n'
+    text += '\n'.join(['<li>{artist} - {title} {album_art}{delete}</li>'.format(
+        artist = escape(track.artists[0].name) if track.artists else 'Unknown Artist',
+        title = escape(track.title),
+        album_art = '<a href="{0}" target="_blank"><img src="{1}" alt="Album art"></a> '.format(track.artists[0].artwork_urls[0], artwork_url('artist', track.artists[0].id)) if track.artists and track.artists[0].artwork_urls else '',
+        delete = '<a class="track-delete" id="{0.id}">Delete</a>'.format(track)
+    ) for track in app.queue])
+    text += '\n</ul>\n<p>Duration: %s.</p>' % queue_duration()
+    return text
+
+# The sections sent by /json, and the functions which render them. Sections
+# in app.versions are global, the rest are attributes of ISettings.
+json_sections = {
+    'now_playing': render_now_playing,
+    'progress': render_progress,
+    'lyrics': render_lyrics,
+    'queue': render_queue,
+    'message': lambda settings: settings.message,
+    'tracks_header': lambda settings: settings.tracks_header,
+    'tracks': render_tracks,
+    'artists': render_artists,
+    'albums': render_albums,
+    'playlists': render_playlists,
+    'artist': render_artist
+}
+
+rendered = {} # section: (version, value) pairs for the global sections, which are the same for every session.
+
+def render_section(section, settings):
+    """Render a section of /json. Global sections are only rendered once per version."""
+    if section not in app.versions:
+        return json_sections[section](settings)
+    version = app.versions[section]
+    if section not in rendered or rendered[section][0] != version:
+        rendered[section] = (version, json_sections[section](settings))
+    return rendered[section][1]
+
+def describe(obj):
+    """Describe a metadata object for a suggestion."""
+    if isinstance(obj, metadata.Track):
+        return '{} - {}'.format(obj.artists[0] if obj.artists else 'Unknown Artist', obj.title)
+    elif isinstance(obj, metadata.Album):
+        return '{} - {}'.format(obj.artists[0] if obj.artists else 'Unknown Artist', obj.name)
+    return obj.name
+
+@route('/suggest/<string>')
+@inlineCallbacks
+def suggest(request, string):
+    """Suggest tracks, artists, albums and playlists matching string as json. Known metadata is searched first, and Google only if nothing is found."""
+    d = {'source': 'local'}
+    results = {}
+    for kind, id in index.suggest(string):
+        obj = getattr(metadata, kind).objects.get(id) # Being suggested doesn't count as being used.
+        if obj is not None:
+            results.setdefault(kind, []).append(obj)
+    for kind, objects in results.items():
+        results[kind] = nsmallest(suggestion_limit, objects, key = describe)
+    if not results:
+        d['source'] = 'remote'
+        try:
+            found = yield cached_search(string)
+            results = found._asdict()
+        except (CallFailure, TimeoutError):
+            pass
+    for kind in ('tracks', 'artists', 'albums', 'playlists'):
+        d[kind] = [{'id': obj.id, 'name': describe(obj)} for obj in results.get(kind, [])[:suggestion_limit]]
+    returnValue(dumps(d))
+
+@route('/events')
+def events(request):
+    """Stream the versions of /json as server-sent events."""
+    return event_stream.subscribe(request)
+
+@route('/json')
+def get_json(request):
+    """
+    Get the contents of settings as json.
+    
+    With ?since=<version>, only the sections which have changed since that version are sent, or 304 if none have.
+    The version to pass next time is returned as version.
+    """
+    settings = ISettings(request.getSession())
+    version = max(app.versions.version, settings.versions.version)
+    try:
+        since = int(convert(request.args.get(b'since', [0])[0]))
+    except ValueError:
+        since = 0
+    if since > version:
+        since = 0 # The server has restarted or the session has expired.
+    if conditional(request, '%s-%d-%d' % (boot, version, since), page_cache_control):
+        return b''
+    sections = (app.versions.changed_since(since) | settings.versions.changed_since(since)).intersection(json_sections)
+    if since and not sections:
+        not_modified(request)
+        return b''
+    d = {'version': version}
+    for section in sections:
+        d[section] = render_section(section, settings)
     return dumps(d)
+
+def artwork_source(kind, id, number):
+    """Return the url of artwork number of the album or artist with the given id, or None if there isn't any."""
+    if kind == 'album':
+        album = metadata.albums.get(id)
+        urls = [album.artwork] if album is not None and album.artwork else []
+    elif kind == 'artist':
+        artist = metadata.artists.get(id)
+        urls = artist.artwork_urls if artist is not None else []
+    else:
+        urls = []
+    if 0 <= number < len(urls):
+        return urls[number]
+    return None
+
+@route('/art/<kind>/<id>')
+@inlineCallbacks
+def get_art(request, kind, id):
+    """A thumbnail of the artwork of an album or artist, from the artwork cache. Artists can have more than one picture, chosen with ?n=."""
+    try:
+        number = int(request.args.get(b'n', [b'0'])[0])
+    except ValueError:
+        number = -1
+    url = artwork_source(kind, id, number)
+    if url is None:
+        request.setResponseCode(404)
+        returnValue('No such artwork.')
+    try:
+        path = yield artwork_cache.get(url)
+    except Exception as e:
+        logger.warning('Failed to fetch artwork from %s: %s', url, e)
+        request.setResponseCode(502)
+        returnValue('Failed to fetch artwork.')
+    if conditional(request, basename(path), 'public, max-age=%d' % artwork_cache.max_age):
+        returnValue(b'')
+    returnValue(File(path))
+
+@route('/metrics')
+def get_metrics(request):
+    """Metrics in the Prometheus text format."""
+    request.setHeader(b'Content-Type', metrics.content_type)
+    return metrics.render()
+
+@route('/admin/blocking')
+def get_blocking(request):
+    """The calls which have blocked the reactor as json, worst first. Only available from localhost. Pass ?reset=1 to start counting again."""
+    if request.transport.getHost().host != localhost:
+        request.setResponseCode(403)
+        return 'Only available from localhost.'
+    report = watchdog.report()
+    if request.args.get(b'reset'):
+        watchdog.reset()
+    request.setHeader(b'Content-Type', b'application/json')
+    return dumps({'enabled': watchdog.enabled, 'threshold': watchdog.threshold, 'blocked': report})
@@ -0,0 +1,84 @@
+"""The play queue."""
+
+from collections import OrderedDict
+from datetime import timedelta
+
+class PlayQueue:
+    """Tracks waiting to be played, indexed by id, with the sessions which queued them. Membership tests, removals and the total duration don't depend on the length of the queue."""
+    def __init__(self):
+        """Create an empty queue."""
+        self.tracks = OrderedDict() # id: track pairs, in the order they will be played.
+        self.owners = {} # id: owner pairs.
+        self.millis = {} # id: duration pairs, as counted in duration_millis.
+        self.duration_millis = 0 # The total duration of the queue.
+        self.listeners = [] # Callables to be called with no arguments whenever the queue changes.
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks.values())
+
+    def __contains__(self, track):
+        """Check whether a track or a track id is queued."""
+        return getattr(track, 'id', track) in self.tracks
+
+    def changed(self):
+        """Tell the listeners the queue has changed."""
+        for listener in self.listeners:
+            listener()
+
+    def append(self, track, owner = None):
+        """Add track to the end of the queue, returning False if it was already queued."""
+        return bool(self.extend([track], owner = owner))
+
+    def extend(self, tracks, owner = None):
+        """Add every track which isn't already queued to the end of the queue, telling the listeners once. Returns the tracks which were added."""
+        added = []
+        for track in tracks:
+            if track.id in self.tracks:
+                continue
+            self.tracks[track.id] = track
+            if owner is not None:
+                self.owners[track.id] = owner
+            self.millis[track.id] = track.duration_millis or 0
+            self.duration_millis += self.millis[track.id]
+            added.append(track)
+        if added:
+            self.changed()
+        return added
+
+    def _remove(self, id):
+        """Remove the track with the given id without telling the listeners, returning (track, owner)."""
+        track = self.tracks.pop(id)
+        self.duration_millis -= self.millis.pop(id)
+        return (track, self.owners.pop(id, None))
+
+    def remove(self, id):
+        """Remove the track with the given id, returning the track, or None if it wasn't queued."""
+        if id not in self.tracks:
+            return None
+        track, owner = self._remove(id)
+        self.changed()
+        return track
+
+    def popleft(self):
+        """Remove the first track, returning (track, owner). Raises IndexError if the queue is empty."""
+        if not self.tracks:
+            raise IndexError('The play queue is empty.')
+        track, owner = self._remove(next(iter(self.tracks)))
+        self.changed()
+        return (track, owner)
+
+    def peek(self):
+        """Return the first track without removing it, or None if the queue is empty."""
+        return next(iter(self.tracks.values()), None)
+
+    def owner(self, track):
+        """Return the owner of track, or None."""
+        return self.owners.get(getattr(track, 'id', track))
+
+    @property
+    def duration(self):
+        """The total duration of the queue as a timedelta."""
+        return timedelta(milliseconds = self.duration_millis)
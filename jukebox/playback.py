@@ -0,0 +1,22 @@
+"""The state of playback, as sampled by the player."""
+
+from collections import namedtuple
+from math import floor
+
+class Playback(namedtuple('Playback', ['track', 'owner', 'position', 'length', 'playing'])):
+    """What is playing, who queued it, and how far through it is, with position and length in seconds. A new Playback is made by the player on every tick, so request handlers always see consistent values without touching the stream."""
+    __slots__ = ()
+
+    @property
+    def progress(self):
+        """The percentage of the track which has been played."""
+        if self.length <= 0:
+            return 0
+        return min(100, floor(100.0 * self.position / self.length))
+
+    @property
+    def remaining(self):
+        """The number of seconds left to play."""
+        return max(0.0, self.length - self.position)
+
+stopped = Playback(None, None, 0.0, 0.0, False) # Nothing playing.
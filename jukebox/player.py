@@ -0,0 +1,181 @@
+"""Plays the queue, preparing each track before the one before it has finished."""
+
+import logging
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.threads import deferToThread
+from .api import async_api
+from . import artist_sections
+from .app import app
+from .lyrics import PLAYING
+from .playback import Playback, stopped
+from . import fake
+
+if fake.enabled:
+    from .fake import FakeBassError as BassError, FakeStream as URLStream
+else:
+    from sound_lib.main import BassError
+    from sound_lib.stream import URLStream
+
+logger = logging.getLogger(__name__)
+
+def free(stream):
+    """Free a stream which will not be played again."""
+    try:
+        stream.free()
+    except BassError as e:
+        logger.debug('Failed to free stream: %s', e)
+
+class Player:
+    """Plays tracks from app.queue. The next track is prepared prebuffer seconds before the current one ends, so there is little or no gap between them. Only the player touches streams; everything else reads app.playback."""
+    def __init__(self, prebuffer = 30.0):
+        """Initialise with the number of seconds before the end of a track to start preparing the next one."""
+        self.prebuffer = prebuffer
+        self.track = None # The track being played.
+        self.owner = None # Whoever queued track.
+        self.stream = None # The stream for track.
+        self.next_track = None # The track being prepared.
+        self.next_stream = None # The stream for next_track, once it is ready.
+        self.next_deferred = None # Fires once next_track has been prepared or has failed.
+        self.starting = None # The Deferred a track waiting to be started is being prepared by, if any.
+        self.end_call = None # The DelayedCall which checks the queue when the current track should end.
+
+    @inlineCallbacks
+    def open(self, track):
+        """Fetch the stream URL for track and open its stream in a thread, fetching the artist's bio at the same time. Returns a Deferred which fires with the stream."""
+        if track.artists and 'header' not in track.artists[0].sections:
+            artist_sections.load(track.artists[0].id).addErrback(lambda failure: logger.warning('Failed to load the artist of %s: %s', track, failure.getErrorMessage())) # The track plays whether or not this works.
+        url = yield async_api.get_stream_url(track.id)
+        stream = yield deferToThread(URLStream, url.encode())
+        returnValue(stream)
+
+    def prepare(self, track):
+        """Start preparing track to be played next, unless it is already being prepared."""
+        if track is self.next_track:
+            return
+        self.discard()
+        logger.debug('Preparing track: %s.', track)
+        self.next_track = track
+        self.next_deferred = self.open(track)
+        self.next_deferred.addCallbacks(self.prepared, self.prepare_failed, callbackArgs = (track,), errbackArgs = (track,))
+
+    def prepared(self, stream, track):
+        """Keep stream if track is still the next track."""
+        if track is self.next_track:
+            self.next_stream = stream
+            self.next_deferred = None
+        else:
+            free(stream)
+
+    def prepare_failed(self, failure, track):
+        """Log the failure to prepare track."""
+        logger.warning('Failed to prepare %s: %s', track, failure.getErrorMessage())
+        if track is self.next_track:
+            self.next_track = None
+            self.next_deferred = None
+
+    def discard(self):
+        """Forget the prepared track, freeing its stream. A stream which is still opening is freed when it opens."""
+        if self.next_stream is not None:
+            free(self.next_stream)
+        self.next_track = None
+        self.next_stream = None
+        self.next_deferred = None
+
+    def play_next(self):
+        """Play the first track in the queue, waiting for it to be prepared if it isn't already."""
+        track, owner = app.queue.popleft()
+        self.prepare(track)
+        if self.next_deferred is None:
+            self.start(track, owner)
+        else:
+            self.starting = self.next_deferred
+            self.starting.addBoth(self.ready, self.starting, track, owner)
+
+    def ready(self, result, pending, track, owner):
+        """Start track now that pending has fired, unless the player has been stopped since."""
+        if pending is self.starting:
+            self.start(track, owner)
+
+    def start(self, track, owner):
+        """Start playing track, which has been prepared."""
+        self.starting = None
+        if self.stream is not None:
+            free(self.stream)
+            self.stream = None
+        if track is not self.next_track or self.next_stream is None:
+            logger.warning('Skipping %s, which could not be prepared.', track)
+            self.stop()
+            return
+        self.stream = self.next_stream
+        self.next_track = None
+        self.next_stream = None
+        track.fetch_lyrics(PLAYING)
+        logger.info('Playing track: %s.', track)
+        self.stream.play()
+        self.track = track
+        self.owner = owner
+        playback = self.sample()
+        app.versions.touch('now_playing')
+        self.schedule_end(playback)
+
+    def schedule_end(self, playback):
+        """Check the queue as soon as the current track should have finished, rather than waiting for the next tick."""
+        if self.end_call is not None and self.end_call.active():
+            self.end_call.cancel()
+        self.end_call = reactor.callLater(playback.remaining + 0.05, self.tick)
+
+    def sample(self):
+        """Read the state of the current stream into a new Playback, which replaces app.playback and is returned."""
+        if self.stream is None:
+            playback = stopped
+        else:
+            try:
+                playback = Playback(self.track, self.owner, self.stream.bytes_to_seconds(self.stream.get_position()), self.stream.bytes_to_seconds(self.stream.get_length()), bool(self.stream.is_playing))
+            except BassError as e:
+                logger.warning('Failed to read the state of the stream for %s: %s', self.track, e)
+                playback = Playback(self.track, self.owner, 0.0, 0.0, False)
+        app.playback = playback
+        return playback
+
+    def stop(self):
+        """Stop playing, without touching the queue. A track waiting to be started is skipped too."""
+        self.starting = None
+        if self.stream is not None:
+            try:
+                self.stream.pause()
+            except BassError:
+                pass
+            free(self.stream)
+        if self.end_call is not None and self.end_call.active():
+            self.end_call.cancel()
+        changed = self.track is not None
+        self.stream = None
+        self.track = None
+        self.owner = None
+        self.sample()
+        if changed:
+            app.versions.touch('now_playing')
+
+    def tick(self):
+        """Sample the current stream into app.playback, start the next track if the current one has finished, prepare the next track if the current one is nearly over, and update the progress of the current track."""
+        if self.starting:
+            return
+        playback = self.sample()
+        if not playback.playing: # The current track has finished playing.
+            if app.queue:
+                self.play_next()
+            else:
+                self.stop()
+            playback = app.playback
+        following = app.queue.peek()
+        if not self.starting and following is not self.next_track:
+            if self.next_track is not None:
+                self.discard() # The queue has changed since the next track was prepared.
+            if following is not None and self.stream is not None and playback.remaining <= self.prebuffer:
+                self.prepare(following)
+        app.versions.observe('now_playing', None if playback.track is None else tuple(x.version for x in [playback.track] + playback.track.artists)) # Catches the track or its artists being populated with new data.
+        app.versions.observe('progress', playback.progress)
+        app.versions.observe('lyrics', (playback.track, None if playback.track is None else playback.track.lyrics))
+
+player = Player()
@@ -0,0 +1,80 @@
+"""Size-limited registries of metadata objects."""
+
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Callables which return the objects in use, which must not be evicted from
+# any registry. Objects referenced by these objects (see the references
+# method of the metadata classes) are also kept.
+pin_sources = []
+
+def pinned():
+    """Return the set of objects which must not be evicted."""
+    objects = set()
+    for source in pin_sources:
+        for obj in source():
+            if obj is not None and obj not in objects:
+                objects.add(obj)
+                objects.update(obj.references())
+    return objects
+
+class Registry:
+    """id: object pairs, evicting the least recently used objects which are not pinned when there are more than max_size."""
+    def __init__(self, name, max_size = None, low_water = 0.9):
+        """Initialise with a name for logging, the maximum number of objects (None for no limit), and the fraction of max_size to evict down to, so eviction happens in batches."""
+        self.name = name
+        self.max_size = max_size
+        self.low_water = low_water
+        self.objects = OrderedDict()
+        self.listeners = [] # Callables to be called with the id of each evicted object.
+
+    def __contains__(self, id):
+        return id in self.objects
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __getitem__(self, id):
+        """Get an object, marking it as recently used."""
+        obj = self.objects[id]
+        self.objects.move_to_end(id)
+        return obj
+
+    def get(self, id, default = None):
+        """Get an object or default."""
+        if id in self.objects:
+            return self[id]
+        return default
+
+    def __setitem__(self, id, obj):
+        """Add or replace an object, marking it as recently used."""
+        self.objects[id] = obj
+        self.objects.move_to_end(id)
+        if self.max_size is not None and len(self.objects) > self.max_size:
+            self.evict()
+
+    def __delitem__(self, id):
+        del self.objects[id]
+
+    def values(self):
+        return self.objects.values()
+
+    def evict(self):
+        """Evict least recently used objects which are not pinned until there are no more than max_size * low_water. The object added most recently is never evicted."""
+        target = int(self.max_size * self.low_water)
+        keep = pinned()
+        evicted = 0
+        for id, obj in list(self.objects.items())[:-1]:
+            if len(self.objects) <= target:
+                break
+            if obj not in keep:
+                del self.objects[id]
+                evicted += 1
+                for listener in self.listeners:
+                    listener(id)
+        logger.debug('Evicted %d objects from %s, leaving %d.', evicted, self.name, len(self.objects))
@@ -0,0 +1,115 @@
+"""Compression and conditional requests for the responses sent by the app."""
+
+import zlib
+from time import time
+from twisted.web.http import NO_BODY_CODES, NOT_MODIFIED
+from twisted.web.resource import EncodingResourceWrapper
+from twisted.web.server import GzipEncoderFactory
+
+level = 6 # The zlib compression level, from 1 (fastest) to 9 (smallest). 0 turns compression off.
+uncompressed = (b'/events', b'/art/') # Paths which are streamed, so must not be buffered by a compressor, or are already compressed.
+
+encodings = ((b'gzip', 16 + zlib.MAX_WBITS), (b'deflate', zlib.MAX_WBITS)) # (name, zlib window bits) pairs, preferred first when the client likes them equally.
+
+boot = '%x' % int(time()) # Versions start again when the jukebox restarts, so ETags made from them must differ between runs.
+
+def accepted_encodings(request):
+    """Return a dictionary of name: quality pairs for the encodings listed by the client which made request. A quality of 0 means the encoding is not acceptable."""
+    accepted = {}
+    for header in request.requestHeaders.getRawHeaders(b'Accept-Encoding', []):
+        for part in header.split(b','):
+            name, _, parameters = part.partition(b';')
+            name = name.strip().lower()
+            if not name:
+                continue
+            quality = 1.0
+            parameters = parameters.replace(b' ', b'')
+            if parameters.startswith(b'q='):
+                try:
+                    quality = float(parameters[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name] = quality
+    return accepted
+
+def compressible(request):
+    """Return True if the response to request may be compressed."""
+    return level > 0 and not request.path.startswith(uncompressed)
+
+def negotiate(request):
+    """Return (name, window bits) for the encoding the response to request should be compressed with, or None if it shouldn't be."""
+    if not compressible(request):
+        return None
+    accepted = accepted_encodings(request)
+    best = None
+    best_quality = 0.0
+    for name, wbits in encodings:
+        quality = accepted.get(name, accepted.get(b'*', 0.0))
+        if quality > best_quality:
+            best = (name, wbits)
+            best_quality = quality
+    return best
+
+class Encoder:
+    """Compresses a response as it is written."""
+    def __init__(self, request, wbits):
+        """Initialise with the request and the zlib window bits, which select gzip or deflate."""
+        self.request = request
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def has_body(self):
+        """Return True if the response has a body. twisted.web.server.Request.finish writes whatever finish returns even when it mustn't, such as for a 304, and the compressor always has something left."""
+        return self.request.method != b'HEAD' and self.request.code not in NO_BODY_CODES
+
+    def encode(self, data):
+        """Compress some of the response."""
+        if not self.has_body():
+            return b''
+        if not self.request.startedWriting:
+            self.request.responseHeaders.removeHeader(b'Content-Length') # The length changes.
+        return self.compressor.compress(data)
+
+    def finish(self):
+        """Return whatever the compressor has left."""
+        remaining = self.compressor.flush() if self.has_body() else b''
+        self.request = None
+        return remaining
+
+class EncoderFactory(GzipEncoderFactory):
+    """Picks gzip or deflate for each request, rather than only gzip."""
+    def encoderForRequest(self, request):
+        """Return an Encoder if the response to request should be compressed, otherwise None."""
+        if compressible(request):
+            request.responseHeaders.addRawHeader(b'Vary', b'Accept-Encoding')
+        encoding = negotiate(request)
+        if encoding is None:
+            return None
+        request.responseHeaders.setRawHeaders(b'Content-Encoding', [encoding[0]])
+        return Encoder(request, encoding[1])
+
+def wrap(resource):
+    """Wrap resource, such as app.resource(), so its responses are compressed."""
+    return EncodingResourceWrapper(resource, [EncoderFactory()])
+
+def not_modified(request):
+    """Make the response to request an empty 304."""
+    request.setResponseCode(NOT_MODIFIED)
+    request.responseHeaders.removeHeader(b'Content-Encoding') # There is no body to encode.
+
+def conditional(request, tag, cache_control = 'no-cache'):
+    """
+    Set the ETag and Cache-Control headers of the response to request, where tag changes whenever the response would.
+
+    Returns True if the client already has the response, in which case the response code is set to 304 and nothing else should be sent.
+    """
+    encoding = negotiate(request)
+    if encoding is not None:
+        tag = '%s-%s' % (tag, encoding[0].decode()) # Strong ETags must differ between encodings.
+    etag = ('"%s"' % tag).encode()
+    request.setHeader(b'ETag', etag)
+    request.setHeader(b'Cache-Control', cache_control.encode())
+    for header in request.requestHeaders.getRawHeaders(b'If-None-Match', []):
+        if header.strip() == b'*' or etag in [value.strip() for value in header.split(b',')]:
+            not_modified(request)
+            return True
+    return False
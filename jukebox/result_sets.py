@@ -0,0 +1,73 @@
+"""Immutable lists of metadata objects, shared between every session which shows the same results."""
+
+from math import ceil
+from weakref import WeakValueDictionary
+from twisted.internet.task import cooperate
+
+result_sets = WeakValueDictionary() # (kind, ids): ResultSet pairs, kept only while something uses them.
+
+page_size = 50 # The most objects shown at once, and converted before a large set is first shown.
+
+class ResultSet:
+    """An immutable sequence of metadata objects of one kind. Sets are addressed by their contents, so a search, an album and a station which contain the same tracks share one set, and the html rendered for it."""
+    __slots__ = ('key', 'objects', 'fragments', 'pages', '__weakref__')
+
+    def __init__(self, key, objects):
+        """Initialise with the key the set is stored under and the objects. Use get_result_set rather than creating sets directly."""
+        self.key = key
+        self.objects = objects
+        self.fragments = {} # name: (key, html) pairs cached by environment.join_fragments.
+        self.pages = {} # (number, size): ResultSet pairs, so each page and its html are only made once.
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __getitem__(self, index):
+        return self.objects[index]
+
+    def page_count(self, size = page_size):
+        """Return the number of pages of size objects, which is at least 1."""
+        return max(1, ceil(len(self.objects) / size))
+
+    def page(self, number, size = page_size):
+        """Return page number (counting from 0) as a ResultSet."""
+        if len(self.objects) <= size:
+            return self
+        key = (number, size)
+        if key not in self.pages:
+            self.pages[key] = get_result_set(self.key[0], self.objects[number * size:(number + 1) * size])
+        return self.pages[key]
+
+    def __repr__(self):
+        return '{0.__class__.__name__}({0.key[0]}, {1} objects)'.format(self, len(self))
+
+def get_result_set(kind, objects):
+    """Return the set of the given kind containing objects in order, creating it if no set with the same contents exists."""
+    objects = tuple(objects)
+    key = (kind, tuple(obj.id for obj in objects))
+    result_set = result_sets.get(key)
+    if result_set is None or any(a is not b for a, b in zip(result_set.objects, objects)): # An object may have been evicted and fetched again since.
+        result_set = ResultSet(key, objects)
+        result_sets[key] = result_set
+    return result_set
+
+def materialise(kind, items, convert, first = page_size, chunk = page_size, cooperate = cooperate):
+    """
+    Convert items, such as the tracks of a playlist, into metadata objects with convert.
+    
+    Returns (head, rest). head is a ResultSet of up to first objects, which are converted straight away. If there are more, rest is a Deferred which fires with a ResultSet of every object, otherwise it is None. The others are converted chunk at a time by cooperate (twisted.internet.task.cooperate by default), so a large playlist doesn't block the reactor.
+    """
+    objects = [convert(item) for item in items[:first]]
+    head = get_result_set(kind, objects)
+    if len(items) <= first:
+        return (head, None)
+    def work():
+        for start in range(first, len(items), chunk):
+            objects.extend(convert(item) for item in items[start:start + chunk])
+            yield
+    d = cooperate(work()).whenDone()
+    d.addCallback(lambda ignored: get_result_set(kind, objects))
+    return (head, d)
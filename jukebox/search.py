@@ -0,0 +1,30 @@
+"""Searching Google Play Music, with results shared between sessions."""
+
+from collections import namedtuple
+from twisted.internet.defer import inlineCallbacks, returnValue
+from . import metadata
+from .api import async_api
+from .cache import DeferredCache
+from .result_sets import get_result_set
+
+class SearchResults(namedtuple('SearchResults', ['tracks', 'artists', 'albums', 'playlists'])):
+    """The results of a search, as a ResultSet of each kind of metadata object."""
+
+def normalise(query):
+    """Normalise a search query so trivially different queries share results."""
+    return ' '.join(query.casefold().split())
+
+@inlineCallbacks
+def _search(query):
+    """Search Google and convert the results to metadata objects."""
+    results = yield async_api.search(query)
+    returnValue(
+        SearchResults(
+            get_result_set('tracks', [metadata.get_track(s['track']) for s in results.get('song_hits', [])]),
+            get_result_set('artists', [metadata.get_artist(a['artist']) for a in results.get('artist_hits', [])]),
+            get_result_set('albums', [metadata.get_album(a['album']) for a in results.get('album_hits', [])]),
+            get_result_set('playlists', [metadata.get_playlist(p['playlist']) for p in results.get('playlist_hits', [])])
+        )
+    )
+
+search = DeferredCache(_search, key = normalise)
@@ -0,0 +1,74 @@
+"""An index of the names of known metadata, for instant suggestions."""
+
+import re
+from bisect import bisect_left, insort
+
+token_re = re.compile(r'\w+')
+
+def tokenise(text):
+    """Split text into a set of lower case words."""
+    return set(token_re.findall(str(text).casefold()))
+
+class SearchIndex:
+    """Maps words to the (kind, id) pairs of the objects whose names contain them. The last word of a query can be a prefix."""
+    def __init__(self):
+        """Create an empty index."""
+        self.postings = {} # token: set of (kind, id) pairs.
+        self.documents = {} # (kind, id): tokens pairs.
+        self.tokens = [] # Every token, sorted for prefix searches.
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, kind, id, text):
+        """Index the object of the given kind and id under the words in text, replacing anything it was indexed under before."""
+        key = (kind, id)
+        tokens = tokenise(text)
+        old = self.documents.get(key, set())
+        if tokens == old:
+            return
+        for token in old - tokens:
+            self.discard_posting(token, key)
+        for token in tokens - old:
+            if token not in self.postings:
+                self.postings[token] = set()
+                insort(self.tokens, token)
+            self.postings[token].add(key)
+        self.documents[key] = tokens
+
+    def remove(self, kind, id):
+        """Remove an object from the index."""
+        for token in self.documents.pop((kind, id), ()):
+            self.discard_posting(token, (kind, id))
+
+    def discard_posting(self, token, key):
+        """Remove key from the postings for token, removing the token if nothing else uses it."""
+        postings = self.postings[token]
+        postings.discard(key)
+        if not postings:
+            del self.postings[token]
+            del self.tokens[bisect_left(self.tokens, token)]
+
+    def prefixed(self, prefix):
+        """Return the keys indexed under any token starting with prefix."""
+        keys = set()
+        for position in range(bisect_left(self.tokens, prefix), len(self.tokens)):
+            token = self.tokens[position]
+            if not token.startswith(prefix):
+                break
+            keys.update(self.postings[token])
+        return keys
+
+    def suggest(self, query):
+        """Return the set of (kind, id) pairs matching every word of query, treating the last word as a prefix."""
+        words = token_re.findall(query.casefold())
+        if not words:
+            return set()
+        keys = self.prefixed(words.pop())
+        for word in words:
+            if not keys:
+                break
+            keys &= self.postings.get(word, set())
+        return keys
+
+index = SearchIndex()
@@ -5,30 +5,69 @@ settings.py: Session-specific settings.
 from zope.interface import Interface, Attribute, implementer
 from twisted.python.components import registerAdapter
 from twisted.web.server import Session
+from functools import partial
+from weakref import WeakSet
+from .state import Versions
+from .events import event_stream
+from .registry import pin_sources
+from .metrics import Gauge
+from .result_sets import get_result_set
 
 class ISettings(Interface):
     """Settings for the current session."""
-    tracks = Attribute('The tracks loaded for this session.')
-    artists = Attribute('The artists loaded for this session.')
-    albums = Attribute('The albums loaded for this session.')
-    playlists = Attribute('The playlists loaded for this session.')
+    tracks = Attribute('The ResultSet of tracks loaded for this session.')
+    artists = Attribute('The ResultSet of artists loaded for this session.')
+    albums = Attribute('The ResultSet of albums loaded for this session.')
+    playlists = Attribute('The ResultSet of playlists loaded for this session.')
     message = Attribute('A message to show to the user.')
     tracks_header = Attribute('The heading before the list of tracks.')
+    tracks_page = Attribute('The page of tracks being shown, counting from 0.')
     artist = Attribute('The currently-focused artist.')
     album = Attribute('The currently-focused album.')
     playlist = Attribute('The currently loaded playlist.')
+    versions = Attribute('The versions of the above attributes.')
+
+tracked_attributes = set(ISettings.names()) - set(['versions'])
+
+instances = WeakSet() # The settings of every live session.
 
 @implementer(ISettings)
 class Settings(object):
     def __init__(self, session):
-        self.tracks = []
-        self.artists = []
-        self.albums = []
-        self.playlists = []
+        instances.add(self)
+        self.versions = Versions()
+        self.versions.listeners.append(partial(event_stream.publish, uid = session.uid))
+        self.tracks = get_result_set('tracks', ())
+        self.artists = get_result_set('artists', ())
+        self.albums = get_result_set('albums', ())
+        self.playlists = get_result_set('playlists', ())
         self.message = None
         self.tracks_header = 'Track Results'
+        self.tracks_page = 0
         self.artist = None
         self.album = None
         self.playlist = None
 
+    def __setattr__(self, name, value):
+        """Record the change so /json knows to send it. Values must be replaced rather than modified in place for this to work. Setting the same object again, such as the ResultSet of a repeated search, is not a change."""
+        changed = getattr(self, name, None) is not value
+        super().__setattr__(name, value)
+        if changed and name in tracked_attributes:
+            self.versions.touch(name)
+
 registerAdapter(Settings, Session, ISettings)
+
+def pinned_by_sessions():
+    """Yield the metadata objects used by live sessions."""
+    for settings in list(instances):
+        yield from settings.tracks
+        yield from settings.artists
+        yield from settings.albums
+        yield from settings.playlists
+        yield settings.artist
+        yield settings.album
+        yield settings.playlist
+
+pin_sources.append(pinned_by_sessions)
+
+Gauge('jukebox_sessions', 'The number of live sessions.', lambda: len(instances))
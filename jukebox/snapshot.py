@@ -0,0 +1,168 @@
+"""Save and restore the metadata registries and the play queue, so restarts don't need to ask Google for everything again."""
+
+import gzip
+import json
+import logging
+import os
+import os.path
+from time import time
+from twisted.internet.defer import inlineCallbacks, TimeoutError
+from twisted.internet.threads import deferToThread
+from gmusicapi.exceptions import CallFailure
+from . import metadata, artist_sections
+from .api import async_api
+from .app import app
+from .registry import pinned, pin_sources
+
+logger = logging.getLogger(__name__)
+
+format_version = 1
+
+# registry name: (class, registry, {slot: name of the registry the slot refers to}).
+kinds = {
+    'tracks': (metadata.Track, metadata.tracks, {'artists': 'artists', 'album': 'albums'}),
+    'artists': (metadata.Artist, metadata.artists, {'top_tracks': 'tracks', 'albums': 'albums', 'related_artists': 'artists'}),
+    'albums': (metadata.Album, metadata.albums, {'artists': 'artists', 'tracks': 'tracks'}),
+    'playlists': (metadata.Playlist, metadata.playlists, {'tracks': 'tracks'})
+}
+
+# Slots which are not saved, and functions returning the values they are restored with.
+transient = {
+    'lyrics': lambda: None, # Lyrics are kept by the lyrics store.
+    'lyrics_fetched': lambda: False,
+    'version': lambda: 0,
+    'fragments': dict,
+    'sections': set, # Artist sections are loaded again when they are next needed.
+    'fingerprint': lambda: None
+}
+
+max_revalidated = 100 # The most objects revalidate refreshes besides the queue, so a restart never re-fetches the whole catalogue.
+
+# class: function returning a Deferred which refreshes the object with the given id, for the objects revalidate refreshes.
+refreshers = {
+    metadata.Track: lambda id: async_api.get_track_info(id).addCallback(metadata.get_track),
+    metadata.Album: lambda id: async_api.get_album_info(id).addCallback(metadata.get_album),
+    metadata.Artist: artist_sections.load
+}
+
+def dump_object(obj, references):
+    """Convert obj to a dictionary, replacing the objects it refers to with their ids."""
+    d = {}
+    for slot in obj.__slots__:
+        if slot in transient:
+            continue
+        value = getattr(obj, slot)
+        if slot in references:
+            if isinstance(value, list):
+                value = [x.id for x in value]
+            elif value is not None:
+                value = value.id
+        d[slot] = value
+    return d
+
+def dump_owner(owner):
+    """Convert the owner of a queued track, which is a session uid, to something json can store."""
+    if isinstance(owner, bytes):
+        return owner.decode()
+    return owner
+
+def dump():
+    """Return the registries and the queue as a dictionary."""
+    objects = set()
+    for cls, registry, references in kinds.values():
+        objects.update(registry.values())
+    objects.update(pinned()) # Includes objects which have been evicted but are still in use.
+    for obj in list(objects):
+        if isinstance(obj, metadata.Track):
+            objects.update(obj.references()) # Tracks always need their album and artists.
+    d = {
+        'format': format_version,
+        'saved': time(),
+        'queue': [[track.id, dump_owner(app.queue.owner(track))] for track in app.queue]
+    }
+    for name, (cls, registry, references) in kinds.items():
+        d[name] = [dump_object(obj, references) for obj in objects if isinstance(obj, cls)]
+    return d
+
+def write(path, d):
+    """Write d to path, replacing the old file only once the new one is complete."""
+    temp = path + '.tmp'
+    with gzip.open(temp, 'wt', encoding = 'utf-8') as f:
+        json.dump(d, f, separators = (',', ':'))
+    os.replace(temp, path)
+
+def save(path):
+    """Save a snapshot to path. The snapshot is taken straight away, but written in a thread. Returns a Deferred."""
+    d = dump()
+    logger.debug('Saving %d queued tracks to %s.', len(d['queue']), path)
+    return deferToThread(write, path, d).addErrback(lambda failure: logger.error('Failed to save snapshot to %s: %s', path, failure.getErrorMessage()))
+
+def save_now(path):
+    """Save a snapshot to path without a thread, for when the reactor has stopped."""
+    write(path, dump())
+    logger.info('Saved snapshot to %s.', path)
+
+def load(path):
+    """Restore the registries and queue from path without contacting Google. Returns the age of the snapshot in seconds."""
+    with gzip.open(path, 'rt', encoding = 'utf-8') as f:
+        d = json.load(f)
+    if d.get('format') != format_version:
+        raise ValueError('Unsupported snapshot format %r.' % d.get('format'))
+    restored = {} # name: {id: object}.
+    for name, (cls, registry, references) in kinds.items():
+        restored[name] = {}
+        for data in d[name]:
+            obj = cls.__new__(cls)
+            for slot in cls.__slots__:
+                if slot in transient:
+                    setattr(obj, slot, transient[slot]())
+                else:
+                    setattr(obj, slot, data.get(slot))
+            restored[name][obj.id] = obj
+    for name, (cls, registry, references) in kinds.items():
+        for obj in restored[name].values():
+            for slot, other in references.items():
+                value = getattr(obj, slot)
+                if isinstance(value, list):
+                    setattr(obj, slot, [restored[other][id] for id in value if id in restored[other]])
+                else:
+                    setattr(obj, slot, restored[other].get(value))
+            registry[obj.id] = obj
+            obj.update_index()
+    for id, owner in d['queue']:
+        track = restored['tracks'].get(id)
+        if track is None:
+            logger.warning('Queued track %r missing from snapshot.', id)
+            continue
+        app.queue.append(track, owner = owner.encode() if isinstance(owner, str) else owner)
+        track.fetch_lyrics()
+    logger.info('Restored %s and %d queued tracks from %s.', ', '.join('%d %s' % (len(restored[name]), name) for name in kinds), len(app.queue), path)
+    return time() - d['saved']
+
+def in_use():
+    """Return the objects restored by load which the player and live sessions are using, and which haven't been populated since, most important first."""
+    objects = {} # Ordered, without duplicates.
+    for source in pin_sources:
+        for obj in source():
+            if obj is not None and type(obj) in refreshers and obj.fingerprint is None: # Only restored objects have no fingerprint.
+                objects[obj] = None
+    return list(objects)
+
+@inlineCallbacks
+def revalidate():
+    """Refresh the queued tracks from Google in the background, then up to max_revalidated other restored objects which are in use, one at a time. Everything else is refreshed the next time a page fetches it."""
+    for track in list(app.queue):
+        try:
+            data = yield async_api.get_track_info(track.id)
+            metadata.get_track(data)
+        except (CallFailure, TimeoutError) as e:
+            logger.warning('Failed to revalidate %s: %s', track, e)
+    app.versions.touch('queue')
+    logger.info('Revalidated the play queue.')
+    objects = in_use()[:max_revalidated]
+    for obj in objects:
+        try:
+            yield refreshers[type(obj)](obj.id)
+        except (CallFailure, TimeoutError) as e:
+            logger.warning('Failed to revalidate %s: %s', obj, e)
+    logger.info('Revalidated %d objects in use.', len(objects))
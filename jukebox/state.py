@@ -0,0 +1,43 @@
+"""Change tracking for the sections sent by /json."""
+
+from itertools import count
+
+_versions = count(1)
+
+def next_version():
+    """Get a new version number. Numbers are shared by the app and every session, so one number can be compared against both."""
+    return next(_versions)
+
+class Versions(dict):
+    """section: version pairs, recording when each section last changed."""
+    def __init__(self, *sections):
+        """Start with all sections marked as changed."""
+        super().__init__()
+        self.values_seen = {} # section: value pairs for sections updated with observe.
+        self.listeners = [] # Callables to be called with the new version whenever a section changes.
+        if sections:
+            self.touch(*sections)
+
+    def touch(self, *sections):
+        """Mark sections as changed, returning the new version."""
+        version = next_version()
+        for section in sections:
+            self[section] = version
+        for listener in self.listeners:
+            listener(version)
+        return version
+
+    def observe(self, section, value):
+        """Mark section as changed if value differs from the last value observed for it."""
+        if section not in self.values_seen or self.values_seen[section] != value:
+            self.values_seen[section] = value
+            self.touch(section)
+
+    @property
+    def version(self):
+        """The most recent version of any section."""
+        return max(self.values(), default = 0)
+
+    def changed_since(self, version):
+        """Return the sections which have changed since version."""
+        return set(section for section, v in self.items() if v > version)
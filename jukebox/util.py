@@ -1,7 +1,6 @@
 """Utility functions."""
 
 import six
-from datetime import timedelta
 from .app import app
 
 def convert(data):
@@ -58,4 +57,4 @@ def format_timedelta(td):
 
 def queue_duration():
     """Get the duration of the queue."""
-    return format_timedelta(sum([track.duration for track in app.queue], timedelta()))
+    return format_timedelta(app.queue.duration)
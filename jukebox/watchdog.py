@@ -0,0 +1,134 @@
+"""Finds calls which block the reactor, by watching it from another thread."""
+
+import logging
+import sys
+import traceback
+from os.path import dirname
+from threading import Event, Lock, Thread, get_ident
+from time import monotonic
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+package_dir = dirname(__file__) # Frames from files in here are blamed in preference to library code.
+
+routes = {} # code: route pairs for the functions behind each route, so stacks can be traced back to requests.
+
+stalls = Counter('jukebox_reactor_stalls_total', 'Times the reactor was blocked for longer than the watchdog threshold, by route.', labels = ('route',))
+
+def blame(frame):
+    """Return (route, location) for the stack ending at frame. route is None if no route handler is on the stack."""
+    route = None
+    location = None
+    while frame is not None:
+        code = frame.f_code
+        if route is None and code in routes:
+            route = routes[code]
+        if location is None and code.co_filename.startswith(package_dir):
+            location = '%s:%d %s' % (code.co_filename[len(package_dir) + 1:], frame.f_lineno, code.co_name)
+        frame = frame.f_back
+    return (route, location)
+
+class Watchdog:
+    """A thread which captures the stack of the reactor thread whenever the reactor goes more than threshold seconds without running its heartbeat."""
+    def __init__(self, threshold = 0.25, interval = 0.05):
+        """Initialise with the number of seconds the reactor must be blocked for before it is reported, and how often the heartbeat runs."""
+        self.threshold = threshold
+        self.interval = interval
+        self.beat = None # When the heartbeat last ran.
+        self.thread_id = None # The reactor thread.
+        self.thread = None
+        self.stopping = Event() # Set to make the thread exit.
+        self.loop = LoopingCall(self.heartbeat)
+        self.lock = Lock()
+        self.blocked = {} # (route, location): {count, seconds, max, stack} dictionaries.
+
+    @property
+    def enabled(self):
+        return self.thread is not None
+
+    def start(self, threshold = None):
+        """Start watching. Must be called from the reactor thread."""
+        if threshold is not None:
+            self.threshold = threshold
+        if self.enabled:
+            return
+        self.interval = min(self.interval, self.threshold / 2) # An idle reactor must never look blocked.
+        self.thread_id = get_ident()
+        self.heartbeat()
+        self.loop.start(self.interval, now = False)
+        self.stopping.clear()
+        self.thread = Thread(target = self.watch, name = 'watchdog', daemon = True)
+        self.thread.start()
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+
+    def stop(self):
+        """Stop watching, waiting for the thread to exit. Does nothing if the watchdog isn't running."""
+        if not self.enabled:
+            return
+        if self.loop.running:
+            self.loop.stop()
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def heartbeat(self):
+        """Show the reactor is running."""
+        self.beat = monotonic()
+
+    def watch(self):
+        """Check the heartbeat until stopped."""
+        reported = None # The beat the reactor was last reported as blocked after.
+        key = None
+        while not self.stopping.wait(self.interval):
+            beat = self.beat
+            if beat == reported:
+                continue
+            if key is not None: # The reactor has recovered from the last block.
+                self.finished(key, beat - reported)
+                key = None
+            blocked = monotonic() - beat
+            if blocked < self.threshold:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            key = blame(frame)
+            stack = ''.join(traceback.format_stack(frame))
+            del frame
+            reported = beat
+            self.record(key, stack)
+            logger.warning('The reactor has been blocked for %.2f seconds by %s (route %s):\n%s', blocked, key[1], key[0], stack)
+
+    def record(self, key, stack):
+        """Count a block."""
+        stalls.inc(route = key[0] or '')
+        with self.lock:
+            if key not in self.blocked:
+                self.blocked[key] = {'count': 0, 'seconds': 0.0, 'max': 0.0}
+            self.blocked[key]['count'] += 1
+            self.blocked[key]['stack'] = stack
+
+    def finished(self, key, seconds):
+        """Record how long a block lasted."""
+        with self.lock:
+            info = self.blocked.get(key)
+            if info is not None: # The blocks may have been reset since.
+                info['seconds'] += seconds
+                info['max'] = max(info['max'], seconds)
+
+    def report(self):
+        """Return a list of the blocks, the worst first."""
+        with self.lock:
+            report = [dict(route = route, location = location, **info) for (route, location), info in self.blocked.items()]
+        report.sort(key = lambda info: info['seconds'], reverse = True)
+        return report
+
+    def reset(self):
+        """Forget every block."""
+        with self.lock:
+            self.blocked.clear()
+
+watchdog = Watchdog()
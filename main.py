@@ -1,46 +1,93 @@
 """The main entry for the jukebox."""
 
-queue_file = 'queue.txt'
+queue_file = 'queue.txt' # Where older versions saved the queue.
 
 if __name__ == '__main__':
     import os
     import os.path
+    import sys
     from default_argparse import parser
     parser.add_argument('--host', default = '0.0.0.0', help = 'The interface on which to run the web server')
     parser.add_argument('-p', '--port', type = int, default = 80, help = 'The port to run the Jukebox on')
     parser.add_argument('-i', '--interval', type = float, default = 0.2, help = 'How often should the jukebox check the queue')
     parser.add_argument('-o', '--output-device', type = int, default = -1, help = 'The output device to use')
+    parser.add_argument('--prebuffer', type = float, default = 30.0, help = 'How many seconds before the end of a track to start loading the next one')
     parser.add_argument('--list-devices', action = 'store_true', help = 'List output devices')
+    parser.add_argument('--api-threads', type = int, default = 4, help = 'How many Google Play Music calls can run at once')
+    parser.add_argument('--api-timeout', type = float, default = 30.0, help = 'How many seconds before a Google Play Music call is abandoned')
+    parser.add_argument('--lyrics-workers', type = int, default = 2, help = 'How many lyrics can be fetched at once')
+    parser.add_argument('--lyrics-db', default = 'lyrics.db', help = 'The file where lyrics are stored')
+    parser.add_argument('--lyrics-ttl', type = float, default = 90.0, help = 'How many days before stored lyrics are fetched again')
+    parser.add_argument('--lyrics-miss-ttl', type = float, default = 1.0, help = 'How many days before lyrics which could not be found are looked for again')
+    parser.add_argument('--search-cache-size', type = int, default = 256, help = 'How many searches to remember the results of')
+    parser.add_argument('--search-cache-ttl', type = float, default = 300.0, help = 'How many seconds to remember the results of a search for')
+    parser.add_argument('--metadata-cap', type = int, default = 5000, help = 'How many tracks, artists, albums and playlists of each to remember')
+    parser.add_argument('--snapshot', default = 'snapshot.json.gz', help = 'The file where metadata and the queue are saved between runs')
+    parser.add_argument('--snapshot-interval', type = float, default = 300.0, help = 'How many seconds between saving snapshots')
+    parser.add_argument('--snapshot-max-age', type = float, default = 3600.0, help = 'How many seconds old a snapshot can be before the queue is refreshed from Google after loading it')
+    parser.add_argument('--reload-templates', action = 'store_true', help = 'Reload templates when they change, rather than compiling them once at startup')
+    parser.add_argument('--template-cache', default = 'template_cache', help = 'The directory where compiled templates are stored')
+    parser.add_argument('--artwork-cache', default = 'artwork_cache', help = 'The directory where artwork thumbnails are stored')
+    parser.add_argument('--artwork-cache-size', type = float, default = 100.0, help = 'How many megabytes of artwork thumbnails to keep')
+    parser.add_argument('--artwork-size', type = int, default = 120, help = 'How many pixels across artwork thumbnails should be')
+    parser.add_argument('--artwork-max-age', type = float, default = 30.0, help = 'How many days browsers may keep artwork thumbnails for')
+    parser.add_argument('--compression-level', type = int, default = 6, help = 'How hard to compress responses, from 1 (fastest) to 9 (smallest), or 0 to send them uncompressed')
+    parser.add_argument('--watchdog', type = float, default = 0.0, help = 'Log the stack whenever the reactor is blocked for more than this many seconds (0 to disable)')
+    parser.add_argument('--fake', action = 'store_true', help = 'Use generated music and silent output instead of Google Play Music and a sound card, for load testing')
+    parser.add_argument('--fake-latency', type = float, default = 0.1, help = 'How many seconds each call to the fake Google Play Music takes')
     parser.add_argument('username', nargs = '?', help = 'Your google username')
     parser.add_argument('password', nargs = '?', help = 'Your Google password')
     args = parser.parse_args()
+    if args.fake:
+        os.environ['JUKEBOX_FAKE'] = '1' # Must be set before anything from the jukebox is imported.
     if args.list_devices:
         print('Output devices:')
         import application
         for x, y in enumerate(application.output.get_device_names()):
             print('[%d] %s.' % (x + 1, y))
         raise SystemExit
-    from configobj import ConfigObj
-    config = ConfigObj('creds.ini')
-    if args.username:
-        config['username'] = args.username
-    if not config.get('username'):
-        config['username'] = input('Enter your Google username: ')
-    if args.password:
-        config['password'] = args.password
-    if not config.get('password'):
-        from getpass import getpass
-        config['password'] = getpass('Password: ')
-    config.write()
+    if not args.fake:
+        from configobj import ConfigObj
+        config = ConfigObj('creds.ini')
+        if args.username:
+            config['username'] = args.username
+        if not config.get('username'):
+            config['username'] = input('Enter your Google username: ')
+        if args.password:
+            config['password'] = args.password
+        if not config.get('password'):
+            from getpass import getpass
+            config['password'] = getpass('Password: ')
+        config.write()
     import logging
     logging.basicConfig(stream = args.log_file, level = args.log_level, format = args.log_format)
     try:
-        from jukebox.api import api
+        from jukebox.api import api, async_api
     except ImportError as e:
         logging.critical(str(e))
         raise SystemExit
+    if args.fake:
+        api.latency = abs(args.fake_latency)
     logging.info('Loaded api %r.', api)
-    from jukebox.app import app, play_manager
+    async_api.configure(threads = max(1, args.api_threads), timeout = abs(args.api_timeout))
+    logging.info('Using up to %d threads for api calls, with a timeout of %.2f seconds.', async_api.pool.max, async_api.timeout)
+    from jukebox import metadata
+    metadata.configure(max(1, args.metadata_cap))
+    logging.info('Remembering up to %d of each kind of metadata.', args.metadata_cap)
+    from jukebox.search import search
+    search.max_size = max(0, args.search_cache_size)
+    search.ttl = abs(args.search_cache_ttl)
+    from jukebox.app import app
+    from jukebox.player import player
+    player.prebuffer = abs(args.prebuffer)
+    from jukebox.lyrics_store import lyrics_store
+    lyrics_store.path = args.lyrics_db
+    lyrics_store.ttl = abs(args.lyrics_ttl) * 86400
+    lyrics_store.miss_ttl = abs(args.lyrics_miss_ttl) * 86400
+    logging.info('Storing lyrics in %s.', lyrics_store.path)
+    from jukebox.lyrics import lyrics_scheduler
+    lyrics_scheduler.start(max(1, args.lyrics_workers))
+    logging.info('Fetching lyrics with %d threads.', lyrics_scheduler.workers)
     import application
     if args.output_device == -1:
         application.output.set_device(application.output.find_default_device())
@@ -52,41 +99,79 @@ if __name__ == '__main__':
             logging.critical('Invalid output device.')
             raise SystemExit
     logging.info('Using sound device %r.', application.output.get_device_names()[application.output.device - 1])
+    from jukebox import environment
+    environment.configure(production = not args.reload_templates, cache_dir = args.template_cache)
+    logging.info('Loaded templates in %s mode.', 'development' if args.reload_templates else 'production')
+    from jukebox.artwork import artwork_cache
+    artwork_cache.directory = args.artwork_cache
+    artwork_cache.max_bytes = int(abs(args.artwork_cache_size) * 1024 * 1024)
+    artwork_cache.size = max(1, args.artwork_size)
+    artwork_cache.max_age = int(abs(args.artwork_max_age) * 86400)
+    if args.fake:
+        from jukebox.fake import fetch_artwork
+        artwork_cache.fetch = fetch_artwork
+    logging.info('Storing up to %d bytes of %d pixel artwork thumbnails in %s.', artwork_cache.max_bytes, artwork_cache.size, artwork_cache.directory)
+    from jukebox import responses
+    responses.level = min(9, max(0, args.compression_level))
+    if responses.level:
+        logging.info('Compressing responses at level %d.', responses.level)
+    else:
+        logging.info('Not compressing responses.')
     from jukebox import pages
     logging.info('Loaded pages from %r.', pages)
     from twisted.internet.task import LoopingCall
-    loop = LoopingCall(play_manager)
+    loop = LoopingCall(player.tick)
     args.interval = abs(args.interval)
     logging.info('Checking the queue every %.2f seconds.', args.interval)
     loop.start(args.interval)
-    if os.path.isfile(queue_file):
-        from jukebox.metadata import get_track
+    from jukebox.metrics import lag_monitor
+    lag_monitor.start()
+    logging.info('Measuring reactor lag every %.2f seconds.', lag_monitor.interval)
+    if args.watchdog > 0:
+        from jukebox.watchdog import watchdog
+        watchdog.start(args.watchdog)
+        logging.info('Reporting calls which block the reactor for more than %.2f seconds.', watchdog.threshold)
+    from twisted.internet import reactor
+    from jukebox import snapshot
+    if os.path.isfile(args.snapshot):
+        try:
+            age = snapshot.load(args.snapshot)
+            if age > args.snapshot_max_age:
+                logging.info('Snapshot is %d seconds old, refreshing the queue.', age)
+                reactor.callWhenRunning(snapshot.revalidate)
+        except Exception as e:
+            logging.warning('Failed to load snapshot from %s:', args.snapshot)
+            logging.exception(e)
+    elif os.path.isfile(queue_file):
         logging.info('Found queue file.')
         with open(queue_file, 'r') as f:
             for line in f.readlines():
                 id = line.strip()
                 try:
                     data = api.get_track_info(id)
-                    track = get_track(data)
+                    track = metadata.get_track(data)
                     logging.info('Loading %r to the queue.')
                     app.queue.append(track)
+                    track.fetch_lyrics()
                 except Exception as e:
                     logging.info('Failed to get track with id %r:', id)
                     logging.exception(e)
                     continue
         os.remove(queue_file)
     else:
-        logging.info('No queue file found.')
+        logging.info('No snapshot found.')
+    snapshot_loop = LoopingCall(snapshot.save, args.snapshot)
+    logging.info('Saving snapshots to %s every %.2f seconds.', args.snapshot, abs(args.snapshot_interval))
+    snapshot_loop.start(abs(args.snapshot_interval), now = False)
     try:
-        app.run(args.host, args.port, logFile = args.log_file)
-        if app.queue:
-            with open(queue_file, 'w') as f:
-                for track in app.queue:
-                    f.write(track.id)
-                    f.write('\n')
-            logging.info('Dumped the queue.')
-        else:
-            logging.info('No queue to dump.')
+        from twisted.python import log
+        from twisted.web.server import Site
+        log.startLogging(args.log_file or sys.stdout)
+        reactor.listenTCP(args.port, Site(responses.wrap(app.resource())), interface = args.host)
+        reactor.run()
+        snapshot.save_now(args.snapshot)
     except Exception as e:
         logging.exception(e)
         logging.critical('Starting the app failed: %s.', e)
+    finally:
+        lyrics_store.close()
@@ -0,0 +1,32 @@
+"""Test loading artists a section at a time."""
+
+import pytest
+from twisted.internet.defer import succeed
+from jukebox import artist_sections, metadata
+from jukebox.api import async_api
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Record calls to get_artist_info, which returns every section whatever it is asked for, and remove the artist afterwards."""
+    calls = []
+    def get_artist_info(id, **arguments):
+        calls.append(arguments)
+        return succeed({'artistId': id, 'name': 'Artist', 'artistBio': 'A bio.', 'topTracks': [], 'albums': [], 'related_artists': []})
+    monkeypatch.setattr(async_api, 'get_artist_info', get_artist_info)
+    yield calls
+    if 'artist' in metadata.artists:
+        del metadata.artists['artist']
+
+def test_sections(calls):
+    results = []
+    artist_sections.load('artist').addCallback(results.append)
+    artist = results[0]
+    assert artist.sections == {'header'} and artist.bio == 'A bio.' # The other sections were stripped from the response.
+    assert calls == [artist_sections.sections['header'][1]]
+    artist_sections.load('artist').addCallback(results.append)
+    assert results[1] is artist and len(calls) == 1 # Already loaded.
+    artist_sections.load('artist', 'top_tracks')
+    assert artist.sections == {'header', 'top_tracks'} and len(calls) == 2
+    assert artist_sections._cache.results == {} # Loaded sections are remembered by the artist, not the cache.
+    with pytest.raises(KeyError):
+        artist_sections.load('artist', 'nonsense')
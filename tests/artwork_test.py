@@ -0,0 +1,24 @@
+"""Test the artwork cache."""
+
+import os
+from twisted.internet.defer import maybeDeferred, succeed
+from jukebox.artwork import ArtworkCache, resized
+
+def test_resized():
+    assert resized('http://lh3.googleusercontent.com/abc', 120) == 'http://lh3.googleusercontent.com/abc=s120'
+    assert resized('https://lh3.googleusercontent.com/abc=w500-h500', 60) == 'https://lh3.googleusercontent.com/abc=s60'
+    assert resized('http://example.com/a.jpg?x=1', 120) == 'http://example.com/a.jpg?x=1'
+
+def test_cache(tmpdir):
+    fetched = []
+    def fetch(url):
+        fetched.append(url)
+        return succeed(('image/png', b'x' * 10))
+    cache = ArtworkCache(directory = str(tmpdir), max_bytes = 25, fetch = fetch, in_thread = maybeDeferred) # Files are written straight away.
+    paths = []
+    for url in ('a', 'b', 'a', 'c'):
+        cache.get(url).addCallback(paths.append)
+    assert fetched == ['a', 'b', 'c']
+    assert paths[0] == paths[2] and paths[0].endswith('.png')
+    assert not os.path.exists(paths[1]) # b was used least recently.
+    assert cache.total == 20 and sorted(os.listdir(str(tmpdir))) == sorted(os.path.basename(p) for p in (paths[0], paths[3]))
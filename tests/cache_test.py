@@ -0,0 +1,59 @@
+"""Test DeferredCache."""
+
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.task import Clock
+from jukebox.cache import DeferredCache
+
+def test_single_flight():
+    calls = []
+    def function(x):
+        calls.append(Deferred())
+        return calls[-1]
+    cache = DeferredCache(function, clock = Clock())
+    results = []
+    cache('a').addCallback(results.append)
+    cache('a').addCallback(results.append)
+    assert len(calls) == 1
+    calls[0].callback(1)
+    assert results == [1, 1]
+    cache('a').addCallback(results.append)
+    assert len(calls) == 1 and results == [1, 1, 1]
+
+def test_expiry_and_size():
+    clock = Clock()
+    calls = []
+    def function(x):
+        calls.append(x)
+        return x * 2
+    cache = DeferredCache(function, max_size = 2, ttl = 10, key = str.lower, clock = clock)
+    cache('a')
+    cache('A')
+    assert calls == ['a']
+    clock.advance(11)
+    cache('a')
+    assert calls == ['a', 'a']
+    cache('b')
+    cache('c')
+    cache('a')
+    assert calls == ['a', 'a', 'b', 'c', 'a']
+
+def test_failures_not_cached():
+    calls = []
+    def function(x):
+        calls.append(x)
+        return fail(ValueError(x))
+    cache = DeferredCache(function, clock = Clock())
+    errors = []
+    cache('a').addErrback(errors.append)
+    cache('a').addErrback(errors.append)
+    assert len(calls) == 2 and len(errors) == 2
+
+def test_zero_ttl():
+    calls = []
+    def function(x):
+        calls.append(x)
+        return x
+    cache = DeferredCache(function, ttl = 0, clock = Clock())
+    cache('a')
+    cache('a')
+    assert calls == ['a', 'a'] and not cache.results
@@ -0,0 +1,11 @@
+"""The benchmark fixtures, which are payloads recorded from Google, shared by the tests."""
+
+import json
+import os.path
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks', 'fixtures')
+
+def load_fixture(name):
+    """Load the fixture with the given name."""
+    with open(os.path.join(fixtures_dir, name + '.json'), 'r') as f:
+        return json.load(f)
@@ -0,0 +1,19 @@
+"""Test the lyrics store."""
+
+from jukebox.lyrics_store import LyricsStore, Lyrics, Engine
+
+def test_store():
+    store = LyricsStore(path = ':memory:')
+    assert store.get('Artist', 'Title') == (False, None)
+    lyrics = Lyrics(Engine('test'), 'La la la')
+    store.put('Artist', 'Title', lyrics)
+    assert store.get('  artist', 'TITLE ') == (True, lyrics)
+    store.put('Artist', 'Instrumental', None)
+    assert store.get('Artist', 'Instrumental') == (True, None)
+
+def test_expiry():
+    store = LyricsStore(path = ':memory:', ttl = -1, miss_ttl = -1)
+    store.put('Artist', 'Title', Lyrics(Engine('test'), 'La la la'))
+    store.put('Artist', 'Instrumental', None)
+    assert store.get('Artist', 'Title') == (False, None)
+    assert store.get('Artist', 'Instrumental') == (False, None)
@@ -0,0 +1,35 @@
+"""Test the metrics."""
+
+import pytest
+from twisted.internet.defer import Deferred
+from jukebox.metrics import Counter, Gauge, Histogram, render, timed, requests, request_seconds
+
+@pytest.fixture
+def registry():
+    """A list of metrics of its own, so tests don't add to the metrics served at /metrics."""
+    return []
+
+def test_render(registry):
+    counter = Counter('test_total', 'A test counter.', labels = ('kind',), registry = registry)
+    counter.inc(kind = 'a')
+    counter.inc(2, kind = 'b"')
+    assert counter.render() == ['# HELP test_total A test counter.', '# TYPE test_total counter', 'test_total{kind="a"} 1.0', 'test_total{kind="b\\""} 2.0']
+    histogram = Histogram('test_seconds', 'A test histogram.', buckets = (0.1, 1.0), registry = registry)
+    histogram.observe(0.5)
+    histogram.observe(2.0)
+    assert histogram.render()[2:] == ['test_seconds_bucket{le="0.1"} 0.0', 'test_seconds_bucket{le="1.0"} 1.0', 'test_seconds_bucket{le="+Inf"} 2.0', 'test_seconds_sum 2.5', 'test_seconds_count 2.0']
+    Gauge('test_value', 'A test gauge.', lambda: 3, registry = registry)
+    assert registry == [counter, histogram, registry[2]] and render(registry).endswith('test_value 3.0\n')
+
+class Request:
+    code = 304
+
+def test_timed_deferred():
+    d = Deferred()
+    route = timed('/test')(lambda request: d)
+    route(Request())
+    assert ('/test', '304') not in requests.values
+    d.callback(b'')
+    assert requests.values[('/test', '304')] == 1
+    assert request_seconds.values[('/test',)][0][-1] == 1
+    del requests.values[('/test', '304')], request_seconds.values[('/test',)]
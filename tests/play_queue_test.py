@@ -0,0 +1,43 @@
+"""Test the play queue."""
+
+from jukebox.play_queue import PlayQueue
+
+class Track:
+    def __init__(self, id, duration_millis):
+        self.id = id
+        self.duration_millis = duration_millis
+
+def test_queue():
+    changes = []
+    q = PlayQueue()
+    q.listeners.append(lambda: changes.append(len(q)))
+    a, b, c = Track('a', 1000), Track('b', 2000), Track('c', None)
+    assert q.append(a, owner = 'me')
+    assert q.append(b)
+    assert q.append(c)
+    assert not q.append(a)
+    assert changes == [1, 2, 3]
+    assert q.duration_millis == 3000
+    assert 'b' in q and b in q
+    assert q.remove('b') is b
+    assert q.remove('b') is None
+    assert b not in q
+    assert q.duration.total_seconds() == 1
+    assert q.peek() is a
+    assert q.popleft() == (a, 'me')
+    assert list(q) == [c]
+    assert q.popleft() == (c, None)
+    assert not q
+    assert q.duration_millis == 0
+
+def test_extend():
+    changes = []
+    q = PlayQueue()
+    q.listeners.append(lambda: changes.append(len(q)))
+    a, b, c = Track('a', 1000), Track('b', 2000), Track('c', 3000)
+    q.append(a)
+    assert q.extend([a, b, c, b], owner = 'me') == [b, c]
+    assert changes == [1, 3]
+    assert q.extend([a, c]) == []
+    assert changes == [1, 3]
+    assert q.duration_millis == 6000 and q.owner(c) == 'me' and q.owner(a) is None
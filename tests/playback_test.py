@@ -0,0 +1,10 @@
+"""Test the playback snapshot."""
+
+from jukebox.playback import Playback, stopped
+
+def test_playback():
+    playback = Playback('track', 'owner', 30.0, 120.0, True)
+    assert playback.progress == 25
+    assert playback.remaining == 90.0
+    assert Playback('track', 'owner', 121.0, 120.0, False).progress == 100
+    assert stopped.progress == 0 and stopped.remaining == 0.0
@@ -0,0 +1,91 @@
+"""Test the player with fake streams."""
+
+from twisted.internet.defer import Deferred
+from jukebox.app import app
+from jukebox.player import Player
+
+class Track:
+    def __init__(self, id):
+        self.id = id
+        self.duration_millis = 1000
+        self.artists = []
+        self.version = 0
+        self.lyrics = None
+
+    def fetch_lyrics(self, priority = None):
+        pass
+
+class Stream:
+    def __init__(self, length = 100.0):
+        self.length = length
+        self.position = 0.0
+        self.is_playing = False
+        self.freed = False
+
+    def play(self):
+        self.is_playing = True
+
+    def pause(self):
+        self.is_playing = False
+
+    def free(self):
+        self.freed = True
+
+    def get_position(self):
+        return self.position
+
+    def get_length(self):
+        return self.length
+
+    def bytes_to_seconds(self, position):
+        return position
+
+def make_player(monkeypatch):
+    """Return a player whose tracks open when opening[track.id] is fired."""
+    player = Player(prebuffer = 30.0)
+    opening = {}
+    def open(track):
+        opening[track.id] = Deferred()
+        return opening[track.id]
+    monkeypatch.setattr(player, 'open', open)
+    return player, opening
+
+def test_prepare_start_and_tick(monkeypatch):
+    player, opening = make_player(monkeypatch)
+    a, b = Track('a'), Track('b')
+    app.queue.extend([a, b], owner = b'me')
+    try:
+        player.tick()
+        assert player.starting and app.playback.track is None
+        first = Stream()
+        opening['a'].callback(first)
+        assert not player.starting and first.is_playing
+        assert app.playback.track is a and app.playback.owner == b'me'
+        player.tick()
+        assert 'b' not in opening # Not yet within prebuffer seconds of the end.
+        first.position = 80.0
+        player.tick()
+        second = Stream()
+        opening['b'].callback(second)
+        assert player.next_stream is second and app.playback.remaining == 20.0
+        first.is_playing = False
+        player.tick()
+        assert first.freed and second.is_playing and app.playback.track is b
+    finally:
+        player.stop()
+        for track in list(app.queue):
+            app.queue.remove(track.id)
+    assert app.playback.track is None
+
+def test_stop_cancels_start(monkeypatch):
+    player, opening = make_player(monkeypatch)
+    a = Track('a')
+    app.queue.append(a)
+    player.tick()
+    assert player.starting
+    player.stop()
+    stream = Stream()
+    opening['a'].callback(stream)
+    assert not stream.is_playing and app.playback.track is None
+    player.tick()
+    assert stream.freed and player.next_track is None
@@ -0,0 +1,25 @@
+"""Test populating metadata from the benchmark fixtures, without contacting Google."""
+
+from jukebox.metadata import get_track, get_artist
+from .fixtures import load_fixture
+
+def test_populate_unchanged():
+    data = load_fixture('search')['song_hits'][0]['track']
+    t = get_track(data)
+    version = t.version
+    assert get_track(dict(data)) is t
+    assert t.version == version
+    remastered = dict(data, title = t.title + ' (Remastered)', durationMillis = '2000')
+    get_track(remastered)
+    assert t.version > version
+    assert (t.title, t.duration_millis) == (remastered['title'], 2000)
+    get_track(data) # Seen before, but not the last payload applied.
+    assert (t.title, t.duration_millis) == (data['title'], int(data['durationMillis']))
+
+def test_populate_artist():
+    data = load_fixture('artist')
+    artist = get_artist(data)
+    version = artist.version
+    get_artist({'artistId': artist.id, 'name': artist.name}) # A stub, as tracks make.
+    assert artist.version == version
+    assert get_artist(data) is artist and artist.version == version
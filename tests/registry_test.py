@@ -0,0 +1,34 @@
+"""Test registries."""
+
+from jukebox.registry import Registry, pin_sources
+
+class Thing:
+    def __init__(self, *references):
+        self.refs = list(references)
+
+    def references(self):
+        return self.refs
+
+def test_lru():
+    r = Registry('test', max_size = 3, low_water = 1)
+    for id in 'abc':
+        r[id] = Thing()
+    r['a'] # Now b is the least recently used.
+    r['d'] = Thing()
+    assert list(r) == ['c', 'a', 'd']
+
+def test_pinned():
+    r = Registry('test', max_size = 2, low_water = 1)
+    child = Thing()
+    parent = Thing(child)
+    r['child'] = child
+    r['parent'] = parent
+    source = lambda: [parent]
+    pin_sources.append(source)
+    try:
+        r['other'] = Thing()
+        r['another'] = Thing()
+    finally:
+        pin_sources.remove(source)
+    assert 'child' in r and 'parent' in r and 'another' in r
+    assert 'other' not in r
@@ -0,0 +1,60 @@
+"""Test compression and conditional requests."""
+
+from twisted.web.test.requesthelper import DummyRequest
+from jukebox import responses
+
+def request(path = b'/json', **headers):
+    r = DummyRequest([])
+    r.path = path
+    for name, value in headers.items():
+        r.requestHeaders.setRawHeaders(name.replace('_', '-').encode(), [value])
+    return r
+
+def test_negotiate():
+    assert responses.negotiate(request(Accept_Encoding = b'deflate, gzip;q=0.5'))[0] == b'deflate'
+    assert responses.negotiate(request(Accept_Encoding = b'deflate, gzip'))[0] == b'gzip'
+    assert responses.negotiate(request(Accept_Encoding = b'*;q=0.1'))[0] == b'gzip'
+    assert responses.negotiate(request(Accept_Encoding = b'gzip;q=0, deflate'))[0] == b'deflate'
+    assert responses.negotiate(request(Accept_Encoding = b'br')) is None
+    assert responses.negotiate(request(b'/events', Accept_Encoding = b'gzip')) is None
+
+def test_conditional():
+    r = request(Accept_Encoding = b'gzip')
+    assert not responses.conditional(r, 'a')
+    etag = r.responseHeaders.getRawHeaders(b'ETag')[0]
+    assert etag == b'"a-gzip"'
+    r = request(Accept_Encoding = b'gzip', If_None_Match = b'"b", ' + etag)
+    assert responses.conditional(r, 'a')
+    assert r.responseCode == 304
+    assert not responses.conditional(request(If_None_Match = etag), 'a') # Uncompressed responses have a different ETag.
+
+def serve(app, path, **headers):
+    """Send a request for path to app, through responses.wrap and a real Site, returning the raw response."""
+    from twisted.internet.testing import StringTransport
+    from twisted.web.server import Site
+    protocol = Site(responses.wrap(app.resource())).buildProtocol(None)
+    transport = StringTransport()
+    protocol.makeConnection(transport)
+    lines = [b'GET ' + path + b' HTTP/1.1', b'Host: localhost'] + [name.replace('_', '-').encode() + b': ' + value for name, value in headers.items()]
+    protocol.dataReceived(b'\r\n'.join(lines) + b'\r\n\r\n')
+    return transport.value()
+
+def test_not_modified_has_no_body():
+    from klein import Klein
+    app = Klein()
+    @app.route('/')
+    def index(request):
+        if responses.conditional(request, 'a'):
+            return b''
+        return b'hello'
+    @app.route('/since')
+    def since(request):
+        responses.not_modified(request)
+        return b''
+    for encoding in (b'gzip', b'deflate'):
+        response = serve(app, b'/', Accept_Encoding = encoding, If_None_Match = b'"a-' + encoding + b'"')
+        assert response.startswith(b'HTTP/1.1 304') and response.endswith(b'\r\n\r\n')
+        response = serve(app, b'/since', Accept_Encoding = encoding)
+        assert response.startswith(b'HTTP/1.1 304') and response.endswith(b'\r\n\r\n')
+        assert b'content-encoding' not in response.lower()
+    assert b'content-encoding: gzip' in serve(app, b'/', Accept_Encoding = b'gzip').lower()
@@ -0,0 +1,45 @@
+"""Test result sets."""
+
+import gc
+from twisted.internet.task import Clock, Cooperator
+from jukebox.result_sets import get_result_set, result_sets, materialise
+
+
+class Thing:
+    def __init__(self, id):
+        self.id = id
+
+def test_shared():
+    a, b = Thing('a'), Thing('b')
+    results = get_result_set('tracks', [a, b])
+    assert get_result_set('tracks', (a, b)) is results
+    assert get_result_set('albums', [a, b]) is not results
+    assert get_result_set('tracks', [b, a]) is not results
+    assert get_result_set('tracks', [Thing('a'), b]) is not results # a was replaced by a new object with the same id.
+    assert list(results) == [a, b] and results[:1] == (a,)
+
+def test_weak():
+    key = get_result_set('tracks', [Thing('c')]).key
+    gc.collect()
+    assert key not in result_sets
+
+def test_pages():
+    things = [Thing(str(x)) for x in range(120)]
+    results = get_result_set('tracks', things)
+    assert results.page_count() == 3
+    assert list(results.page(2)) == things[100:]
+    assert results.page(0) is results.page(0) is get_result_set('tracks', things[:50])
+    short = get_result_set('tracks', things[:10])
+    assert short.page_count() == 1 and short.page(0) is short
+
+def test_materialise():
+    clock = Clock()
+    cooperator = Cooperator(scheduler = lambda f: clock.callLater(0.01, f))
+    head, rest = materialise('tracks', list(range(120)), lambda x: Thing(str(x)), first = 50, chunk = 50, cooperate = cooperator.cooperate)
+    assert len(head) == 50
+    results = []
+    rest.addCallback(results.append)
+    while not results:
+        clock.advance(1)
+    assert [thing.id for thing in results[0]] == [str(x) for x in range(120)]
+    assert materialise('tracks', [1], lambda x: Thing(str(x)))[1] is None
@@ -0,0 +1,24 @@
+"""Test the search index."""
+
+from jukebox.search_index import SearchIndex
+
+def test_suggest():
+    index = SearchIndex()
+    index.add('tracks', 't1', 'Yesterday The Beatles')
+    index.add('tracks', 't2', 'Let It Be The Beatles')
+    index.add('artists', 'a1', 'The Beatles')
+    assert index.suggest('beat') == set([('tracks', 't1'), ('tracks', 't2'), ('artists', 'a1')])
+    assert index.suggest('beatles yes') == set([('tracks', 't1')])
+    assert index.suggest('yesterday beatles') == set([('tracks', 't1')])
+    assert index.suggest('stones') == set()
+    assert index.suggest('  ') == set()
+
+def test_update_and_remove():
+    index = SearchIndex()
+    index.add('artists', 'a1', 'Unknown Artist')
+    index.add('artists', 'a1', 'Queen')
+    assert index.suggest('unknown') == set()
+    assert index.suggest('que') == set([('artists', 'a1')])
+    index.remove('artists', 'a1')
+    assert index.suggest('que') == set()
+    assert index.tokens == [] and index.postings == {}
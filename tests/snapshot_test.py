@@ -0,0 +1,38 @@
+"""Test saving and restoring snapshots."""
+
+import os.path
+import pytest
+from jukebox import metadata, snapshot
+from jukebox.app import app
+from .fixtures import load_fixture
+
+@pytest.fixture
+def registries(monkeypatch):
+    """Put the metadata registries and the queue back as they were after the test."""
+    monkeypatch.setattr(metadata.Track, 'fetch_lyrics', lambda self, priority = None: None) # Restored tracks ask for lyrics, which must not be looked up.
+    before = {registry: dict(registry.objects) for registry in metadata.registries}
+    queued = set(track.id for track in app.queue)
+    yield
+    for track in list(app.queue):
+        if track.id not in queued:
+            app.queue.remove(track.id)
+    for registry, objects in before.items():
+        for id in set(registry) - set(objects):
+            for listener in registry.listeners:
+                listener(id)
+        registry.objects.clear()
+        registry.objects.update(objects)
+
+def test_round_trip(tmpdir, registries):
+    album = metadata.get_album(load_fixture('album'))
+    track = album.tracks[0]
+    app.queue.append(track, owner = b'owner')
+    path = os.path.join(str(tmpdir), 'snapshot.json.gz')
+    snapshot.save_now(path)
+    app.queue.remove(track.id)
+    assert snapshot.load(path) >= 0
+    restored = metadata.tracks.objects[track.id]
+    assert restored is not track and restored.title == track.title
+    assert restored.album is metadata.albums.objects[album.id] and restored.album.tracks[0] is restored
+    assert [(t, app.queue.owner(t)) for t in app.queue] == [(restored, b'owner')]
+    assert snapshot.in_use()[0] is restored # Revalidated first.
@@ -0,0 +1,21 @@
+"""Test state."""
+
+from jukebox.state import Versions
+
+def test_touch():
+    v = Versions('a', 'b')
+    assert v['a'] == v['b'] == v.version
+    since = v.version
+    assert v.changed_since(since) == set()
+    v.touch('a')
+    assert v.changed_since(since) == set(['a'])
+    assert v.version > since
+
+def test_observe():
+    v = Versions()
+    v.observe('progress', 1)
+    version = v.version
+    v.observe('progress', 1)
+    assert v.version == version
+    v.observe('progress', 2)
+    assert v.changed_since(version) == set(['progress'])
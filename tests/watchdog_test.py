@@ -0,0 +1,20 @@
+"""Test the watchdog."""
+
+from time import sleep
+from jukebox.watchdog import Watchdog
+
+def blocking_call():
+    sleep(0.3)
+
+def test_watchdog():
+    watchdog = Watchdog(threshold = 0.1, interval = 0.02)
+    watchdog.start()
+    try:
+        blocking_call()
+    finally:
+        watchdog.stop()
+    assert watchdog.thread is None
+    report = watchdog.report()
+    assert len(report) == 1
+    assert report[0]['count'] == 1
+    assert 'blocking_call' in report[0]['stack']